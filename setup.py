@@ -32,6 +32,7 @@ setup(
         'sphinx_rtd_theme'
     ],
     include_package_data=True,
+    package_data={'sphinx_sql': ['static/*']},
     cmdclass=cmdclass,
     command_options={
         'build_sphinx': {
@@ -2,16 +2,32 @@ from . import __version__
 from pathlib import Path
 from types import SimpleNamespace
 from collections import defaultdict
+from functools import partial
+from html import escape
+import hashlib
+import io
+import logging as pylogging
+import multiprocessing
 import re
 import json
+import subprocess
+import tarfile
+import time
+import zipfile
 
 from ddlparse import DdlParse
 
 import docutils.nodes as n
 from docutils.parsers.rst import Directive, directives
 
+from sphinx.transforms.post_transforms import SphinxPostTransform
 from sphinx.util import logging
 
+try:
+    from sphinx.util.display import status_iterator
+except ImportError:  # Sphinx < 6.1
+    from sphinx.util import status_iterator
+
 logger = logging.getLogger(__name__)
 
 
@@ -22,10 +38,40 @@ class Config:
     ---------
     sphinxsql_include_table_attributes : :obj:`bool` (Defaults to True)
         Extract Columns from Tables defined in DDL files.
+    sphinxsql_compact_search_index : :obj:`bool` (Defaults to False)
+        Keep attribute and change log tables out of the Sphinx search index
+        and write a prefix-sharded JSON index of objects and columns instead
+        (HTML builders only).
+    sphinxsql_infer_dependencies : :obj:`bool` (Defaults to False)
+        Scan view, function and procedure bodies for references to the
+        other documented objects and list them next to the declared
+        dependant objects, flagging the undeclared ones.
+    sphinxsql_lazy_details : :obj:`bool` (Defaults to False)
+        Move parameter, attribute and change log tables into one JSON file
+        per object that is only fetched when the table is expanded (html,
+        dirhtml and singlehtml builders only).
+    sphinxsql_parse_timeout : :obj:`float` (Defaults to None)
+        Seconds a single file may take to parse. When set, parsing runs in
+        a worker process that is killed once the budget is spent and the
+        file is skipped.
+    sphinxsql_max_file_size : :obj:`int` (Defaults to None)
+        Skip files with more characters than this without parsing them.
+        Files on disk are checked by their size in bytes before they are
+        read.
+    sphinxsql_log_file : :obj:`str` (Defaults to None)
+        Write every warning, one JSON object per line, to this file
+        (relative to the build output directory). The console only gets a
+        summary per category.
     """
 
     _config_values = {
         "sphinxsql_include_table_attributes": (True, "env"),
+        "sphinxsql_compact_search_index": (False, "env"),
+        "sphinxsql_infer_dependencies": (False, "env"),
+        "sphinxsql_lazy_details": (False, "html"),
+        "sphinxsql_parse_timeout": (None, "env"),
+        "sphinxsql_max_file_size": (None, "env"),
+        "sphinxsql_log_file": (None, ""),
     }
 
     def __init__(self, **settings):
@@ -37,6 +83,8 @@ class Config:
 
 # Define SQL Table types
 TABLE_TYPES = ["TABLE", "EXTERNAL TABLE", "FOREIGN TABLE"]
+# Object types whose body is scanned by sphinxsql_infer_dependencies
+INFERRED_DEPENDENCY_TYPES = {"VIEW", "MATERIALIZED VIEW", "FUNCTION", "PROCEDURE"}
 # Define SQL object types consisting of two words
 special_obj_type = [
     "EXTERNAL",
@@ -45,15 +93,263 @@ special_obj_type = [
 ]
 
 
+class sql_table(n.General, n.Element):
+    """Compact table node holding its header and rows as plain tuples.
+
+    A docutils table needs a ``row``, ``entry`` and ``Text`` node for every
+    cell, which adds up quickly on wide tables and long change logs. The
+    HTML builders render this node straight from the tuples, every other
+    builder gets it expanded into a standard table by
+    :class:`SqlTableTransform`.
+
+    Attributes
+    ---------
+    header : :obj:`tuple` of :obj:`str`
+        Column titles.
+    rows : :obj:`tuple` of :obj:`tuple` of :obj:`str`
+        Data rows.
+    link_column : :obj:`int` or None
+        Index of the column whose cells link to the object anchor of the
+        same name (used for dependant objects).
+    kind : :obj:`str`
+        What the table lists (parameters, dependencies, attributes,
+        changelog).
+    """
+
+
+class ParseBudgetExceeded(Exception):
+    """A file went over its parse time or size budget.
+
+    Attributes
+    ---------
+    phase : :obj:`str`
+        Parsing phase that was running when the budget ran out.
+    reason : :obj:`str`
+        Which budget was exceeded, e.g. "30s timeout".
+    """
+
+    def __init__(self, phase, reason):
+        super().__init__(f"{reason} exceeded during {phase}")
+        self.phase = phase
+        self.reason = reason
+
+    def __reduce__(self):
+        # Skipped files are kept in the (pickled) parse cache
+        return type(self), (self.phase, self.reason)
+
+
+# Warning categories summarised at the end of each autosql directive
+ISSUE_CATEGORIES = {
+    "unparsable": "file(s) could not be parsed",
+    "no_comments": "file(s) without usable sphinx-sql comments",
+    "parse_budget": "file(s) skipped for exceeding the parse budget",
+    "malformed_table": "object(s) with malformed comment tables",
+}
+# Number of paths listed per category in the summary
+ISSUE_SUMMARY_PATHS = 5
+
+# Table kinds left out of the Sphinx search index in compact search mode
+UNINDEXED_TABLE_KINDS = {"attributes", "changelog"}
+# Length of the name prefix used to shard the compact search index
+SEARCH_SHARD_PREFIX = 2
+# Stem of the file listing all shards, longer than any shard name
+SEARCH_SHARD_MANIFEST = "shards"
+
+# Table kinds loaded on demand in lazy details mode
+LAZY_TABLE_KINDS = {"parameters", "attributes", "partitions", "changelog"}
+# Builders that support lazy details, they need JavaScript and fetch()
+LAZY_DETAILS_BUILDERS = {"html", "dirhtml", "singlehtml"}
+# Output directory of the lazy detail files, relative to the build root
+LAZY_DETAILS_DIR = "_static/sphinxsql_details"
+
+
+def expand_sql_table(node):
+    """Return a standard docutils table equivalent to a :class:`sql_table`."""
+    table = n.table()
+    tgroup = n.tgroup()
+    tbody = n.tbody()
+    link_column = node.get("link_column")
+
+    for _ in range(len(node["rows"][0])):
+        tgroup += n.colspec(colwidth=1)
+
+    header = n.row()
+    for title in node["header"]:
+        header += n.entry("", n.paragraph(text=title))
+
+    for row in node["rows"]:
+        r = n.row()
+        for cidx, cell in enumerate(row):
+            entry = n.entry()
+            if cidx == link_column:
+                para = n.paragraph()
+                entry += para
+                para += n.reference(cell, cell, refuri="#{}".format(n.make_id(cell)))
+            else:
+                entry += n.Text(cell)
+            r += entry
+        tbody += r
+    tgroup += n.thead("", header)
+    tgroup += tbody
+    table += tgroup
+    return table
+
+
+def defer_detail_tables(document, docname, outdir):
+    """Move the detail tables of each object out of the page.
+
+    The header and rows of every :class:`sql_table` listed in
+    LAZY_TABLE_KINDS are written to one JSON file per object section,
+    mapping the table kind to ``{"header", "rows"}``. The
+    node keeps its data (for the search index) and gets a ``details``
+    attribute with the file path, relative to the output root, which makes
+    :func:`visit_sql_table_html` render a collapsed placeholder instead.
+    """
+    details = defaultdict(dict)
+    for node in document.findall(sql_table):
+        if node.get("kind") not in LAZY_TABLE_KINDS:
+            continue
+        section = node.parent
+        if not isinstance(section, n.section) or not section["ids"]:
+            continue
+        path = "{}/{}/{}.json".format(LAZY_DETAILS_DIR, docname, section["ids"][0])
+        node["details"] = path
+        details[path][node["kind"]] = {
+            "header": list(node["header"]),
+            "rows": [list(row) for row in node["rows"]],
+        }
+
+    # Sub-documents have their own sub-directory, only this document's
+    # files are replaced
+    docdir = Path(outdir, LAZY_DETAILS_DIR, docname)
+    for stale in docdir.glob("*.json"):
+        stale.unlink()
+    for path, tables in details.items():
+        target = Path(outdir, path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(json.dumps(tables, sort_keys=True), encoding="utf-8")
+
+
+def visit_sql_table_html(self, node):
+    """Render a :class:`sql_table` by joining escaped strings directly."""
+    if node.get("details"):
+        # Filled in by sphinxsql_details.js when expanded
+        rows = len(node["rows"])
+        self.body.append(
+            '<details class="sphinxsql-details" data-src="{}" data-kind="{}">'
+            "<summary>Show {} row{}</summary></details>\n".format(
+                escape(node["details"]),
+                escape(node["kind"]),
+                rows,
+                "" if rows == 1 else "s",
+            )
+        )
+        raise n.SkipNode
+
+    link_column = node.get("link_column")
+    parts = ['<table class="docutils align-default">\n<thead>\n<tr class="row-odd">']
+    for title in node["header"]:
+        parts.append('<th class="head"><p>{}</p></th>'.format(escape(title)))
+    parts.append("</tr>\n</thead>\n<tbody>\n")
+    for ridx, row in enumerate(node["rows"]):
+        parts.append('<tr class="row-odd">' if ridx % 2 else '<tr class="row-even">')
+        for cidx, cell in enumerate(row):
+            text = escape(cell)
+            if cidx == link_column:
+                text = '<a class="reference internal" href="#{}">{}</a>'.format(
+                    n.make_id(cell), text
+                )
+            parts.append("<td>{}</td>".format(text))
+        parts.append("</tr>\n")
+    parts.append("</tbody>\n</table>\n")
+    self.body.append("".join(parts))
+    raise n.SkipNode
+
+
+class SqlTableTransform(SphinxPostTransform):
+    """Prepare :class:`sql_table` nodes for the current builder.
+
+    HTML builders keep the compact node, with one ``Text`` child holding all
+    cell values so the search index still sees them (unless
+    ``sphinxsql_compact_search_index`` keeps that table kind out). With
+    ``sphinxsql_lazy_details`` the detail tables are also written to JSON
+    files, see :func:`defer_detail_tables`. Other builders get a standard
+    docutils table.
+    """
+
+    default_priority = 200
+
+    def run(self, **kwargs):
+        is_html = self.app.builder.format == "html"
+        if (
+            self.config.sphinxsql_lazy_details
+            and self.app.builder.name in LAZY_DETAILS_BUILDERS
+        ):
+            defer_detail_tables(
+                self.document, self.env.docname, self.app.builder.outdir
+            )
+        unindexed = set()
+        if self.config.sphinxsql_compact_search_index:
+            unindexed = UNINDEXED_TABLE_KINDS
+        for node in list(self.document.findall(sql_table)):
+            if is_html:
+                if node.get("kind") in unindexed:
+                    continue
+                words = [*node["header"]]
+                for row in node["rows"]:
+                    words.extend(row)
+                node += n.Text(" ".join(words))
+            else:
+                node.replace_self(expand_sql_table(node))
+
+
 class SqlDirective(Directive):
     has_content = False
     option_spec = {"sqlsource": directives.unchanged}
 
-    # Most of these regex strings should be case-insensitive lookups
-    closing_regex = (
-        r"((?=return:)|(?=purpose:)|(?=dependent objects:)|"
-        r"(?=changelog:)|(?=parameters)|(?=\*/))"
+    # Set by run() when sphinxsql_parse_timeout is configured
+    watchdog = None
+    # Set by run() to collect warnings for the summary, see report_issue()
+    issues = None
+
+    # Header comment keywords, see parse_header(). Keywords ending a section
+    # are listed in header_closing, keywords starting one in header_sections.
+    header_keywords = (
+        "parameters:",
+        "parameters",
+        "return:",
+        "purpose:",
+        "dependent objects:",
+        "objects:",
+        "changelog:",
+        "*/",
+        "object name:",
+        "object type:",
     )
+    header_closing = {
+        "parameters:",
+        "parameters",
+        "return:",
+        "purpose:",
+        "dependent objects:",
+        "changelog:",
+        "*/",
+    }
+    header_sections = {
+        "parameters:": "param",
+        "purpose:": "purpose",
+        "objects:": "dependencies",
+        "changelog:": "changelog",
+    }
+    header_section_order = (
+        "param",
+        "return_type",
+        "purpose",
+        "dependencies",
+        "changelog",
+    )
+
+    # Most of these regex strings should be case-insensitive lookups
     regex_dict = {
         # Full comment block
         "top_sql_block_comments": r"(?s)/*.*?\*/",
@@ -72,21 +368,43 @@ class SqlDirective(Directive):
         "distributed_by": r"distributed by \(.*?\)",
         # Match Group 2 for partition type (range) Group 3 for partition key.
         "partition_by": r"partition by \(.*?\)",
+        # Match Group 1 for the partition, Group 2 for the parent table of a
+        # declarative partition (CREATE TABLE ... PARTITION OF ...)
+        "partition_of": r"create\s+(?:\w+\s+)*?table\s+(?:if\s+not\s+exists\s+)?"
+        r"([\w.\"]+)\s+partition\s+of\s+([\w.\"]+)",
+        # Match Group 1 for the parent table, Group 2 for the partition
+        # (pg_dump output)
+        "attach_partition": r"alter\s+table\s+(?:only\s+)?([\w.\"]+)\s+"
+        r"attach\s+partition\s+([\w.\"]+)",
+        # Partition bound keywords, each followed by a parenthesized list
+        "partition_values": r"\s*for\s+values\s+(?:in|from|with)\s*(?=\()",
+        "partition_values_to": r"\s*to\s*(?=\()",
+        "partition_default": r"\s*default\b",
+        # SQL comments and string literals
+        "sql_noise": r"--[^\n]*|/\*.*?\*/|'(?:[^']|'')*'",
         # Match Group 1 for language
         "language": r"(language .*?)\;",
         "comments": {
-            "object_name": r"(?<=Object Name:)(\s\S*)",
-            "object_type": r"(?<=Object Type:)(\s\S*)",
-            "parameters": rf"(?s)(?<=parameters:)(.*?){closing_regex}",
-            "return_type": r"Return:(.?\w.*)",
-            "purpose": rf"(?s)(?<=purpose:)(.*?){closing_regex}",
-            "dependencies": rf"(?s)(?<=objects:)(.*?){closing_regex}",
-            "changelog": rf"(?s)(?<=changelog:)(.*?){closing_regex}",
+            # Zero width, so overlapping keywords (the "objects:" in
+            # "dependent objects:") are all found. The number of the matching
+            # group is the position of the keyword in header_keywords.
+            "keywords": "(?={})".format(
+                "|".join(f"({re.escape(keyword)})" for keyword in header_keywords)
+            ),
+            # Value following "Object Name:" and "Object Type:"
+            "object_field": r"\s\S*",
+            # Value following "Return:"
+            "return_type": r".?\w.*",
         },
         # Match Group 1 for Schema, Group 2 for Table Name,
         # Group 3 for Field Name, Group 4 for Comment on Column
         "col_comment": r"(?<=comment on column)\s*(\w*)\.(\w*)"
         r"\.(\w*)\s*IS.*'(.*)';",
+        # Match Group 1 for the object kind, Group 2 for the target and
+        # Group 3 for the comment of any COMMENT ON statement
+        "comment_on": r"comment\s+on\s+(materialized\s+view|foreign\s+table|"
+        r"external\s+table|\w+)\s+([\w.\"]+)(?:\s*\([^;]*?\))?\s+is\s+"
+        r"'((?:[^']|'')*)'",
         # Match complete Constraint part
         "constraints": r"^\s*CONSTRAINT.*\n*.*\),?",
         # Match create table definition and everything below
@@ -106,36 +424,26 @@ class SqlDirective(Directive):
     objdist = re.compile(regex_strings.distributed_by, re.IGNORECASE | re.MULTILINE)
     objpart = re.compile(regex_strings.partition_by, re.IGNORECASE | re.MULTILINE)
     objlang = re.compile(regex_strings.language, re.IGNORECASE | re.MULTILINE)
+    objpartof = re.compile(regex_strings.partition_of, re.IGNORECASE)
+    objattach = re.compile(regex_strings.attach_partition, re.IGNORECASE)
+    objpartvalues = re.compile(regex_strings.partition_values, re.IGNORECASE)
+    objpartvaluesto = re.compile(regex_strings.partition_values_to, re.IGNORECASE)
+    objpartdefault = re.compile(regex_strings.partition_default, re.IGNORECASE)
+    objnoise = re.compile(regex_strings.sql_noise, re.DOTALL)
     top_comments = re.compile(
         regex_strings.top_sql_block_comments, re.IGNORECASE | re.MULTILINE
     )
 
     # Compile Comment Regex
-    objname = re.compile(
-        regex_strings.comments.object_name, re.IGNORECASE | re.MULTILINE
-    )
-    objtype = re.compile(
-        regex_strings.comments.object_type, re.IGNORECASE | re.MULTILINE
-    )
-    objpara = re.compile(
-        regex_strings.comments.parameters, re.IGNORECASE | re.MULTILINE
-    )
-    objreturn = re.compile(
-        regex_strings.comments.return_type, re.IGNORECASE | re.MULTILINE
-    )
-    objpurpose = re.compile(
-        regex_strings.comments.purpose, re.IGNORECASE | re.MULTILINE
-    )
-    objdepen = re.compile(
-        regex_strings.comments.dependencies, re.IGNORECASE | re.MULTILINE
-    )
-    objchange = re.compile(
-        regex_strings.comments.changelog, re.IGNORECASE | re.MULTILINE
-    )
+    objkeywords = re.compile(regex_strings.comments.keywords, re.IGNORECASE)
+    objfield = re.compile(regex_strings.comments.object_field)
+    objreturn = re.compile(regex_strings.comments.return_type, re.IGNORECASE)
 
     # Complie SQL Comment on Column Regex
     objcol_comment = re.compile(regex_strings.col_comment, re.IGNORECASE | re.MULTILINE)
 
+    objcomment_on = re.compile(regex_strings.comment_on, re.IGNORECASE)
+
     # Complie SQL Constraint Regex
     objconstraints = re.compile(regex_strings.constraints, re.IGNORECASE | re.MULTILINE)
 
@@ -152,6 +460,295 @@ class SqlDirective(Directive):
         files = Path(srcpath).rglob("*.sql")
         return files
 
+    def is_sql_archive(self, srcpath):
+        """Check whether `srcpath` is a tar or zip archive of SQL sources."""
+        srcpath = Path(srcpath)
+        if not srcpath.is_file():
+            return False
+        return zipfile.is_zipfile(srcpath) or tarfile.is_tarfile(srcpath)
+
+    def get_sql_archive_members(self, srcpath):
+        """Yield ``(file, key, read)`` for every ``.sql`` member of an archive.
+
+        Members are streamed straight out of the archive, nothing is
+        extracted to disk. `file` is the member path joined to the archive
+        path. For zip archives `key` is built from the member CRC, so
+        unchanged members are not even decompressed; tar archives have no
+        checksum, so `key` is None there. `read` is only valid until the
+        next member is requested.
+        """
+        srcpath = Path(srcpath)
+        if zipfile.is_zipfile(srcpath):
+            with zipfile.ZipFile(srcpath) as archive:
+                for info in archive.infolist():
+                    if info.is_dir() or not info.filename.endswith(".sql"):
+                        continue
+                    file = srcpath / info.filename
+                    key = "zip:{:08x}:{}".format(info.CRC, info.file_size)
+                    read = partial(self.read_sql_member, archive.open, info, file)
+                    yield file, key, read
+        else:
+            # Stream mode reads the archive front to back exactly once
+            with tarfile.open(srcpath, mode="r|*") as archive:
+                for member in archive:
+                    if not member.isfile() or not member.name.endswith(".sql"):
+                        continue
+                    file = srcpath / member.name
+                    read = partial(
+                        self.read_sql_member, archive.extractfile, member, file
+                    )
+                    yield file, None, read
+
+    def count_sql_archive_members(self, srcpath):
+        """Return the number of ``.sql`` members of an archive.
+
+        Only zip archives have a member index; streamed tar archives would
+        have to be read twice, so None is returned for them.
+        """
+        if not zipfile.is_zipfile(srcpath):
+            return None
+        with zipfile.ZipFile(srcpath) as archive:
+            return sum(
+                1
+                for info in archive.infolist()
+                if not info.is_dir() and info.filename.endswith(".sql")
+            )
+
+    def read_sql_member(self, opener, member, file):
+        with opener(member) as raw:
+            data = raw.read()
+        # Decode the same way open() does for files on disk
+        return io.TextIOWrapper(io.BytesIO(data)).read()
+
+    def get_sql_sources(self, srcpath):
+        """Yield ``(file, key, read)`` for every SQL source under `srcpath`.
+
+        `key` is an already known content key (git blob ID, zip CRC) or
+        None, `read` returns the file contents.
+        """
+        if self.is_sql_archive(srcpath):
+            yield from self.get_sql_archive_members(srcpath)
+            return
+
+        blob_ids = self.get_git_blob_ids(srcpath) or {}
+        for file in self.get_sql_files(srcpath):
+            yield file, blob_ids.get(str(file)), partial(self.read_sql_file, file)
+
+    def get_git_blob_ids(self, srcpath):
+        """Return git blob IDs of the clean ``.sql`` files under `srcpath`.
+
+        Blob IDs come from the git index (``git ls-files -s``) and act as
+        ready-made content keys. Files that are modified, untracked or
+        unmerged are left out so they get hashed instead. Returns None when
+        `srcpath` is not inside a git work tree.
+        """
+        try:
+            staged = subprocess.run(
+                ["git", "ls-files", "-s", "-z", "--", "*.sql"],
+                cwd=srcpath,
+                capture_output=True,
+                check=True,
+            ).stdout.decode()
+            dirty = subprocess.run(
+                ["git", "ls-files", "-m", "-o", "--exclude-standard", "-z", "--", "*.sql"],
+                cwd=srcpath,
+                capture_output=True,
+                check=True,
+            ).stdout.decode()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+        dirty_files = set(filter(None, dirty.split("\0")))
+        blob_ids = {}
+        for entry in filter(None, staged.split("\0")):
+            # <mode> SP <blob id> SP <stage> TAB <path>
+            info, name = entry.split("\t", 1)
+            _, blob_id, stage = info.split()
+            if stage != "0" or name in dirty_files:
+                dirty_files.add(name)
+                continue
+            blob_ids[str(Path(srcpath, name))] = blob_id
+        for name in dirty_files:
+            blob_ids.pop(str(Path(srcpath, name)), None)
+        return blob_ids
+
+    def get_parse_cache_key(self, config, srcdir):
+        """Return the key of the parse cache for `srcdir`.
+
+        The key includes every option that changes parse results, or which
+        files are parsed at all (the parse budgets). Changing one of them
+        starts from an empty cache instead of serving objects parsed under
+        the old settings; the Sphinx environment itself is kept.
+        """
+        return (
+            str(srcdir),
+            config.sphinxsql_include_table_attributes,
+            config.sphinxsql_infer_dependencies,
+            config.sphinxsql_parse_timeout,
+            config.sphinxsql_max_file_size,
+        )
+
+    def get_cached_core_text(self, config, file, key, read, cache, new_cache):
+        """Return the parsed object for `file`, reusing `cache` when possible.
+
+        `key` is the known content key of the file (git blob ID, zip CRC);
+        when it is None, a SHA-1 of the contents is used instead. Files
+        with a known key are only read when it changed since the cached
+        parse. The file's COMMENT ON statements are cached alongside, see
+        :meth:`build_comment_index`; files holding only those are not
+        reported as unparsable.
+
+        Raises :class:`ParseBudgetExceeded` for files over the parse
+        budget. Time budget skips are cached too, so an unchanged file is
+        not run into the timeout again.
+        """
+        path = str(file)
+        max_size = config.sphinxsql_max_file_size
+        if (
+            max_size is not None
+            and Path(file).is_file()
+            and Path(file).stat().st_size > max_size
+        ):
+            raise ParseBudgetExceeded("read", f"{max_size} character size limit")
+
+        contents = None
+        if key is None:
+            contents = read()
+            key = hashlib.sha1(contents.encode()).hexdigest()
+
+        cached = cache.get(path)
+        if cached and len(cached) == 4 and cached[0] == key:
+            _, core, issues, comment_entries = cached
+        else:
+            if contents is None:
+                contents = read()
+            # Hold back the parse warnings until the file is known to be
+            # more than a COMMENT ON file
+            collected, self.issues = self.issues, []
+            try:
+                core = self.parse_with_budget(config, contents, file)
+            except ParseBudgetExceeded as e:
+                core = e
+            finally:
+                issues, self.issues = self.issues, collected
+            if isinstance(core, ParseBudgetExceeded) and core.phase == "read":
+                # Too large to scan at all
+                comment_entries = []
+            else:
+                comment_entries = self.extract_comment_entries(contents)
+            if core is None and comment_entries:
+                issues = []
+        for issue in issues:
+            self.report_issue(*issue)
+        new_cache[path] = (key, core, issues, comment_entries)
+        if isinstance(core, ParseBudgetExceeded):
+            raise ParseBudgetExceeded(core.phase, core.reason)
+        return core
+
+    def extract_comment_entries(self, contents):
+        """Return the ``[kind, target, comment]`` of each COMMENT ON statement.
+
+        Kinds are upper case (TABLE, COLUMN, FUNCTION, ...), targets lower
+        case without quotes or argument lists.
+        """
+        return [
+            [
+                " ".join(kind.upper().split()),
+                target.lower().replace('"', ""),
+                comment.replace("''", "'"),
+            ]
+            for kind, target, comment in self.objcomment_on.findall(contents)
+        ]
+
+    def build_comment_index(self, cache):
+        """Index the COMMENT ON entries of all cached files by (kind, target).
+
+        Files are applied in path order, so the last comment wins like it
+        would when the files are run in that order.
+        """
+        index = {}
+        for path in sorted(cache):
+            for kind, target, comment in cache[path][3]:
+                index[(kind, target)] = comment
+        return index
+
+    def join_comment_index(self, cores, index):
+        """Add COMMENT ON descriptions to objects and undescribed columns.
+
+        The object comment becomes the ``description`` attribute. Cores are
+        shared with the parse cache, so changed ones are copied.
+        """
+        joined = []
+        for core in cores:
+            kinds = [core.type]
+            if core.type in TABLE_TYPES:
+                kinds.append("TABLE")
+            description = next(
+                (index[(kind, core.name)] for kind in kinds if (kind, core.name) in index),
+                None,
+            )
+            cols = getattr(core, "cols", [])
+            col_comments = [
+                index.get(("COLUMN", "{}.{}".format(core.name, col[0])))
+                if not col[2]
+                else None
+                for col in cols[1:]
+            ]
+            if description is not None or any(col_comments):
+                core = SimpleNamespace(**vars(core))
+                if description is not None:
+                    core.description = description
+                if any(col_comments):
+                    core.cols = [cols[0]] + [
+                        [col[0], col[1], comment] if comment else col
+                        for col, comment in zip(cols[1:], col_comments)
+                    ]
+            joined.append(core)
+        return joined
+
+    def parse_with_budget(self, config, contents, file):
+        """Parse `contents` within the configured size and time budget.
+
+        Raises :class:`ParseBudgetExceeded` when the file is too large or
+        the watchdog had to stop the parse.
+        """
+        max_size = config.sphinxsql_max_file_size
+        if max_size is not None and len(contents) > max_size:
+            raise ParseBudgetExceeded("read", f"{max_size} character size limit")
+        if self.watchdog is not None:
+            return self.watchdog.parse(contents, file)
+        return self.parse_core_text(config, contents, file)
+
+    def report_phase(self, phase):
+        """Hook called as each parsing phase starts (used by the watchdog)."""
+
+    def report_issue(self, category, source, message):
+        """Collect a warning for the summary at the end of run().
+
+        `category` is a key of ``ISSUE_CATEGORIES``, `source` the file or
+        object the warning is about. Outside of run() the warning is logged
+        right away.
+        """
+        if self.issues is None:
+            logger.warning(message)
+        else:
+            self.issues.append((category, str(source), message))
+
+    def summarize_issues(self):
+        """Log one warning per category with a count and the first paths."""
+        by_category = defaultdict(list)
+        for category, source, _ in self.issues:
+            by_category[category].append(source)
+        for category, sources in by_category.items():
+            listed = ", ".join(sources[:ISSUE_SUMMARY_PATHS])
+            if len(sources) > ISSUE_SUMMARY_PATHS:
+                listed += f" (+{len(sources) - ISSUE_SUMMARY_PATHS} more)"
+            logger.warning(
+                f"sphinx-sql: {len(sources)} {ISSUE_CATEGORIES[category]}: {listed}",
+                type="sphinx_sql",
+                subtype=category,
+            )
+
     def extract_sql_col_comments(self, ddl, schema_name, table_name):
         """Return SQL Comment Statements on Columns.
         Helper function for extract_columns().
@@ -241,88 +838,206 @@ class SqlDirective(Directive):
 
         return fields
 
-    def extract_core_text(self, config, file):
+    def mask_sql_noise(self, contents):
+        """Blank out comments and the text of string literals.
+
+        The result has the same length as `contents`, so match positions
+        can be used to slice the original text.
+        """
+
+        def mask(match):
+            text = match[0]
+            if text.startswith("'"):
+                return "'" + "_" * (len(text) - 2) + "'"
+            return " " * len(text)
+
+        return self.objnoise.sub(mask, contents)
+
+    def skip_parentheses(self, text, pos):
+        """Return the position after the balanced parentheses at `pos`.
+
+        Whitespace before the opening parenthesis is skipped. Returns
+        `pos` when there is no opening parenthesis, and None when it is
+        never closed.
+        """
+        start = pos
+        while start < len(text) and text[start].isspace():
+            start += 1
+        if start == len(text) or text[start] != "(":
+            return pos
+        depth = 0
+        for index in range(start, len(text)):
+            if text[index] == "(":
+                depth += 1
+            elif text[index] == ")":
+                depth -= 1
+                if depth == 0:
+                    return index + 1
+        return None
+
+    def extract_partition_bound(self, text, pos):
+        """Return the end of the FOR VALUES clause or DEFAULT at `pos`."""
+        match = self.objpartdefault.match(text, pos)
+        if match:
+            return match.end()
+        match = self.objpartvalues.match(text, pos)
+        if not match:
+            return None
+        end = self.skip_parentheses(text, match.end())
+        if end is None:
+            return None
+        match = self.objpartvaluesto.match(text, end)
+        if match:
+            end = self.skip_parentheses(text, match.end())
+        return end
+
+    def extract_partition_parent(self, contents, table_name):
+        """Return the parent table and bound of a partition child.
+
+        Both declarative partitions (``CREATE TABLE ... PARTITION OF``) and
+        pg_dump's ``ALTER TABLE ... ATTACH PARTITION`` are recognised, but
+        only for the statements naming `table_name` as the partition. The
+        bound is the normalised FOR VALUES clause, or "" if it could not be
+        read. Returns None for tables that are not a partition.
+        """
+        # Comments and string literals must not count
+        masked = self.mask_sql_noise(contents)
+
+        def normalise(name):
+            return name.lower().replace('"', "")
+
+        def bound(pos):
+            end = self.extract_partition_bound(masked, pos)
+            if end is None:
+                return ""
+            return " ".join(contents[pos:end].split())
+
+        for match in self.objpartof.finditer(masked):
+            child, parent = normalise(match[1]), normalise(match[2])
+            if child == table_name and parent != table_name:
+                # Skip the optional column and constraint list
+                end = self.skip_parentheses(masked, match.end())
+                return parent, bound(end) if end is not None else ""
+        for match in self.objattach.finditer(masked):
+            parent, child = normalise(match[1]), normalise(match[2])
+            if child == table_name and parent != table_name:
+                return parent, bound(match.end())
+        return None
+
+    def extract_body(self, contents):
+        """Return the object definition without the header comment."""
+        if self.top_comments.findall(contents):
+            contents = contents.replace(self.top_comments.findall(contents)[0], "")
+        return contents
+
+    def read_sql_file(self, file):
         with open(file) as f:
-            logger.info(file)
-            contents = f.read()
-            object_details = {}
-            if self.obj_schema.findall(contents):
-                sql_type_schema = self.obj_schema.findall(contents)[0]
-                sql_type = (
-                    f"{sql_type_schema[1]} {sql_type_schema[2]}",
-                    sql_type_schema[4],
-                    sql_type_schema[5],
-                    sql_type_schema[6],
-                )
-            elif self.obj_cluster_catalog.findall(contents):
-                sql_type_cluster_catalog = self.obj_cluster_catalog.findall(contents)[0]
-                # Create a tuple matching to length of obj_schema
-                sql_type = (
-                    sql_type_cluster_catalog[0],
-                    sql_type_cluster_catalog[2],
-                    "",
-                    "",
+            return f.read()
+
+    def extract_core_text(self, config, file):
+        contents = self.read_sql_file(file)
+        return self.parse_core_text(config, contents, file)
+
+    def parse_core_text(self, config, contents, file):
+        """Extract the documented object from the contents of a SQL file."""
+        object_details = {}
+        self.report_phase("object type")
+        if self.obj_schema.findall(contents):
+            sql_type_schema = self.obj_schema.findall(contents)[0]
+            sql_type = (
+                f"{sql_type_schema[1]} {sql_type_schema[2]}",
+                sql_type_schema[4],
+                sql_type_schema[5],
+                sql_type_schema[6],
+            )
+        elif self.obj_cluster_catalog.findall(contents):
+            sql_type_cluster_catalog = self.obj_cluster_catalog.findall(contents)[0]
+            # Create a tuple matching to length of obj_schema
+            sql_type = (
+                sql_type_cluster_catalog[0],
+                sql_type_cluster_catalog[2],
+                "",
+                "",
+            )
+        try:
+            if "sql_type" in locals():
+                # DDL file
+                # Read name and type from ANSI92 SQL objects first
+                object_details["type"] = str(sql_type[0]).upper().strip()
+                if object_details["type"] == "PROC":
+                    object_details["type"] = "PROCEDURE"
+
+                object_details["name"] = (
+                    str(sql_type[1]).lower().strip().replace('"', "")
                 )
-            try:
-                if "sql_type" in locals():
-                    # DDL file
-                    # Read name and type from ANSI92 SQL objects first
-                    object_details["type"] = str(sql_type[0]).upper().strip()
-                    if object_details["type"] == "PROC":
-                        object_details["type"] = "PROCEDURE"
-
-                    object_details["name"] = (
-                        str(sql_type[1]).lower().strip().replace('"', "")
-                    )
 
-                    if object_details["type"] in TABLE_TYPES:
-                        dist = self.objdist.findall(contents)
-                        part = self.objpart.findall(contents)
-                        object_details["distribution_key"] = dist
-                        object_details["partition_key"] = part
-                        if config.sphinxsql_include_table_attributes:
-                            try:
-                                object_details["cols"] = self.extract_columns(
-                                    contents, sql_type[2], sql_type[3]
-                                )
-                            except Exception:
-                                # If no columns can be extracted
-                                object_details["cols"] = []
-
-                    elif object_details["type"] in {"FUNCTION", "PROCEDURE"}:
-                        lang = self.objlang.findall(contents)
-                        object_details["language"] = lang
-
-                    if self.top_comments.findall(contents):
-                        comment = self.top_comments.findall(contents)[0]
-                        object_details["comments"] = self.extract_comments(comment)
-                    else:
-                        object_details["comments"] = None
-                else:
-                    # Likely a DML file
-                    dml = self.top_comments.findall(contents)[0]
-                    if dml:
-                        oname = self.objname.search(str(dml))
-                        otype = self.objtype.search(str(dml))
-                        if not oname or not otype:
-                            return None
-                        else:
-                            object_details["type"] = (
-                                otype[0].rstrip("\\n").strip().upper()
-                            )
-                            object_details["name"] = (
-                                oname[0].rstrip("\\n").strip().lower()
+                if object_details["type"] in TABLE_TYPES:
+                    dist = self.objdist.findall(contents)
+                    part = self.objpart.findall(contents)
+                    object_details["distribution_key"] = dist
+                    object_details["partition_key"] = part
+                    partition = self.extract_partition_parent(
+                        contents, object_details["name"]
+                    )
+                    if partition:
+                        # Partitions inherit the columns of their parent
+                        parent, bound = partition
+                        object_details["partition_of"] = parent
+                        object_details["partition_bound"] = bound
+                    elif config.sphinxsql_include_table_attributes:
+                        self.report_phase("table columns")
+                        try:
+                            object_details["cols"] = self.extract_columns(
+                                contents, sql_type[2], sql_type[3]
                             )
-                            object_details["comments"] = self.extract_comments(str(dml))
-                    else:
+                        except Exception:
+                            # If no columns can be extracted
+                            object_details["cols"] = []
+
+                elif object_details["type"] in {"FUNCTION", "PROCEDURE"}:
+                    lang = self.objlang.findall(contents)
+                    object_details["language"] = lang
+
+                if (
+                    config.sphinxsql_infer_dependencies
+                    and object_details["type"] in INFERRED_DEPENDENCY_TYPES
+                ):
+                    object_details["body"] = self.extract_body(contents)
+
+                self.report_phase("header comment")
+                if self.top_comments.findall(contents):
+                    comment = self.top_comments.findall(contents)[0]
+                    object_details["comments"] = self.extract_comments(comment)
+                else:
+                    object_details["comments"] = None
+            else:
+                # Likely a DML file
+                self.report_phase("header comment")
+                dml = self.top_comments.findall(contents)[0]
+                if dml:
+                    header = self.parse_header(str(dml))
+                    oname = header.pop("object_name", None)
+                    otype = header.pop("object_type", None)
+                    if not oname or not otype:
                         return None
-            except Exception as e:
-                logger.warning(
-                    f"""No top level comments found in file.
-                    The exception raised: {e}.
-                    Not a DML file. Skipping {file}"""
-                )
-                return None
+                    else:
+                        object_details["type"] = (
+                            otype.rstrip("\\n").strip().upper()
+                        )
+                        object_details["name"] = (
+                            oname.rstrip("\\n").strip().lower()
+                        )
+                        object_details["comments"] = header
+                else:
+                    return None
+        except Exception as e:
+            self.report_issue(
+                "unparsable",
+                file,
+                f"No top level comments found in file. The exception raised: {e}. "
+                f"Not a DML file. Skipping {file}",
+            )
+            return None
 
         object_details = json.loads(
             json.dumps(object_details), object_hook=lambda item: SimpleNamespace(**item)
@@ -331,76 +1046,95 @@ class SqlDirective(Directive):
         return object_details
 
     def extract_comments(self, str_comment):
-        obj_comment = {}
-        if self.objpara.findall(str_comment):
-            sparam = self.objpara.findall(str_comment)[0]
-            obj_comment["param"] = self.split_to_list(sparam)
-        if self.objreturn.findall(str_comment):
-            obj_comment["return_type"] = (
-                str(self.objreturn.findall(str_comment)[0]).lower().strip()
-            )
-        if self.objpurpose.findall(str_comment):
-            obj_comment["purpose"] = str(
-                self.objpurpose.findall(str_comment)[0][0]
-            ).strip()
-        if self.objdepen.findall(str_comment):
-            sod = self.objdepen.findall(str_comment)[0]
-            obj_comment["dependencies"] = self.split_to_list(sod)
-        if self.objchange.findall(str_comment):
-            scl = self.objchange.findall(str_comment)[0]
-            obj_comment["changelog"] = self.split_to_list(scl)
-
-        return obj_comment
-
-    def split_to_list(self, source):
-        slist = []
-        source = "".join(source)
-        source = [x.strip() for x in source.splitlines()]
-        for line in self.non_blank_lines(source):
-            sline = [x.strip() for x in line.split("|")]
-            slist.append(sline)
-        return slist
-
-    def non_blank_lines(self, f):
-        for vline in f:
-            line = vline.rstrip()
-            if line:
-                yield line
+        header = self.parse_header(str_comment)
+        return {
+            key: header[key] for key in self.header_section_order if key in header
+        }
+
+    def parse_header(self, str_comment):
+        """Split a header comment into its keyword sections in one pass.
+
+        Returns a dict with the sections found: "param", "dependencies" and
+        "changelog" as lists of pipe-delimited rows, "purpose" and
+        "return_type" as text, and "object_name" / "object_type" as the raw
+        value following the keyword.
+
+        Keywords are matched case-insensitively anywhere in a line. A
+        section starts after the first occurrence of its keyword and ends
+        at the next closing keyword (or ``*/``); a section that is never
+        closed is dropped.
+        """
+        header = {}
+        # Rows of the open table sections, and where each open section's
+        # text starts
+        rows = {}
+        open_sections = {}
+        offset = 0
+
+        def add_row(key, start, end):
+            text = str_comment[start:end].strip()
+            if text:
+                rows[key].append([cell.strip() for cell in text.split("|")])
+
+        for line in str_comment.splitlines(keepends=True):
+            line_end = offset + len(line)
+            for match in self.objkeywords.finditer(line):
+                keyword = self.header_keywords[match.lastindex - 1]
+                pos = offset + match.start()
+                end = pos + len(keyword)
+
+                if keyword in self.header_closing:
+                    for key, start in open_sections.items():
+                        if key == "purpose":
+                            header[key] = str_comment[start:pos].strip()
+                        else:
+                            add_row(key, max(start, offset), pos)
+                            header[key] = rows.pop(key)
+                    open_sections.clear()
+
+                key = self.header_sections.get(keyword)
+                if key is not None:
+                    # Only the first occurrence of a section keyword counts
+                    if key not in header and key not in open_sections:
+                        open_sections[key] = end
+                        rows[key] = []
+                elif keyword == "return:":
+                    value = self.objreturn.match(str_comment, end)
+                    if value and "return_type" not in header:
+                        header["return_type"] = value[0].lower().strip()
+                elif keyword in ("object name:", "object type:"):
+                    key = keyword[:-1].replace(" ", "_")
+                    value = self.objfield.match(str_comment, end)
+                    if value and key not in header:
+                        header[key] = value[0]
+
+            # Table sections still open take the rest of the line as a row
+            for key, start in open_sections.items():
+                if key != "purpose":
+                    add_row(key, max(start, offset), line_end)
+            offset = line_end
+
+        return header
 
     def convert_string_to_markup(self, s):
         ns = str(s).replace("\t", "    ")
         return ns
 
-    def build_table(self, titles: str, tabledata: str, is_dependant: bool = False):
-        table = n.table()
-        tgroup = n.tgroup()
-        tbody = n.tbody()
-
-        for _ in range(len(tabledata[0])):
-            colspec = n.colspec(colwidth=1)
-            tgroup += colspec
-
-        for tidx, row in enumerate(tabledata):
-            header = n.row()
-            for title in titles:
-                header += n.entry("", n.paragraph(text=title))
-            r = n.row()
-            for cidx, cell in enumerate(row):
-                entry = n.entry()
-                if is_dependant and tidx >= 0 and cidx == 1:
-                    para = n.paragraph()
-                    entry += para
-                    para += n.reference(
-                        cell, cell, refuri="#{}".format(n.make_id(cell))
-                    )
-                else:
-                    entry += n.Text(cell)
-
-                r += entry
-            tbody += r
-        tgroup += n.thead("", header)
-        tgroup += tbody
-        table += tgroup
+    def build_table(
+        self,
+        titles: str,
+        tabledata: str,
+        is_dependant: bool = False,
+        kind: str = "",
+    ):
+        if not tabledata:
+            raise ValueError("table has no data rows")
+        table = sql_table(
+            header=tuple(str(title) for title in titles),
+            rows=tuple(tuple(str(cell) for cell in row) for row in tabledata),
+            link_column=1 if is_dependant else None,
+            kind=kind,
+        )
         return table
 
     def build_table_row(self, rowdata):
@@ -448,14 +1182,16 @@ class SqlDirective(Directive):
                     ptable = self.build_table(
                         core_text.comments.param[0],  # table header
                         core_text.comments.param[1:],  # data rows
+                        kind="parameters",
                     )
                     section += ptable
                 except Exception as e:
-                    logger.warning(
-                        f"""Unable to parse function parameters from {core_text.name}.
-                        The exception raised: {e}.
-                        Check your .sql source comments for proper
-                        formatting!"""
+                    self.report_issue(
+                        "malformed_table",
+                        core_text.name,
+                        f"Unable to parse function parameters from {core_text.name}. "
+                        f"The exception raised: {e}. Check your .sql source "
+                        "comments for proper formatting!",
                     )
             else:
                 section += n.line("None", "None")
@@ -473,6 +1209,20 @@ class SqlDirective(Directive):
                 section += n.line(
                     core_text.partition_key[0], core_text.partition_key[0]
                 )
+            if hasattr(core_text, "partition_of"):
+                partition_of = "PARTITION OF: {} {}".format(
+                    core_text.partition_of, core_text.partition_bound
+                ).rstrip()
+                section += n.line(partition_of, partition_of)
+
+        if hasattr(core_text, "description"):
+            # COMMENT ON the object
+            section += n.line("", "")
+            section += n.line("DESCRIPTION:", "DESCRIPTION:")
+            description = n.literal_block()
+            description["language"] = "none"
+            description += n.Text(self.convert_string_to_markup(core_text.description))
+            section += description
 
         if hasattr(core_text.comments, "purpose"):
             # Purpose block
@@ -494,16 +1244,27 @@ class SqlDirective(Directive):
                         core_text.comments.dependencies[0],  # table header
                         core_text.comments.dependencies[1:],  # data rows
                         True,
+                        kind="dependencies",
                     )
                 except Exception as e:
-                    logger.warning(
-                        f"""Unable to parse dependant objects from {core_text.name}.
-                         The exception raised: {e}.
-                         Check your .sql source comments for proper
-                         formatting!"""
+                    self.report_issue(
+                        "malformed_table",
+                        core_text.name,
+                        f"Unable to parse dependant objects from {core_text.name}. "
+                        f"The exception raised: {e}. Check your .sql source "
+                        "comments for proper formatting!",
                     )
                 section += dtable
 
+        if hasattr(core_text, "inferred_dependencies"):
+            section += n.line("INFERRED DEPENDENCIES:", "INFERRED DEPENDENCIES:")
+            section += self.build_table(
+                ["Type", "Name", "Declared"],
+                core_text.inferred_dependencies,
+                True,
+                kind="dependencies",
+            )
+
         if core_text.type in TABLE_TYPES:
             if hasattr(core_text, "cols") and len(core_text.cols) > 0:
                 # Attributes block
@@ -514,16 +1275,24 @@ class SqlDirective(Directive):
                     atable = self.build_table(
                         core_text.cols[0],  # table header
                         core_text.cols[1:],  # data rows
+                        kind="attributes",
                     )
                 except Exception as e:
-                    logger.warning(
-                        f"""Unable to parse table attributes
-                        from {core_text.name}. The exception raised: {e}.
-                        Check your .sql source comments for proper
-                        formatting!"""
+                    self.report_issue(
+                        "malformed_table",
+                        core_text.name,
+                        f"Unable to parse table attributes from {core_text.name}. "
+                        f"The exception raised: {e}. Check your .sql source "
+                        "comments for proper formatting!",
                     )
                 section += atable
 
+            if hasattr(core_text, "partitions"):
+                section += n.line("PARTITIONS:", "PARTITIONS:")
+                section += self.build_table(
+                    ["Name", "Bound"], core_text.partitions, kind="partitions"
+                )
+
         if hasattr(core_text.comments, "changelog"):
             section += n.line("CHANGE LOG:", "CHANGE LOG:")
             # The first row is treated as table header
@@ -532,17 +1301,120 @@ class SqlDirective(Directive):
                 ctable = self.build_table(
                     core_text.comments.changelog[0],  # table header
                     core_text.comments.changelog[1:],  # data rows
+                    kind="changelog",
                 )
             except Exception as e:
-                logger.warning(
-                    f"""Unable to parse change log from {core_text.name}.
-                    The exception raised: {e}. Check your .sql source
-                    comments for proper formatting!"""
+                self.report_issue(
+                    "malformed_table",
+                    core_text.name,
+                    f"Unable to parse change log from {core_text.name}. "
+                    f"The exception raised: {e}. Check your .sql source "
+                    "comments for proper formatting!",
                 )
             section += ctable
 
         return section
 
+    def collapse_partitions(self, cores):
+        """Fold partition children into the table they belong to.
+
+        Children whose parent (or an ancestor, for sub-partitions) is among
+        ``cores`` are removed from the list and listed as [name, bound] rows
+        in the ``partitions`` attribute of a copy of that table. Children
+        without a documented parent stay as they are.
+        """
+        tables = {core.name: core for core in cores if core.type in TABLE_TYPES}
+
+        def top_parent(core):
+            # Sub-partitions go to the top-most documented table
+            seen = {core.name}
+            parent = None
+            while getattr(core, "partition_of", None) in tables:
+                core = tables[core.partition_of]
+                if core.name in seen:
+                    return None
+                seen.add(core.name)
+                parent = core.name
+            return parent
+
+        partitions = defaultdict(list)
+        collapsed = []
+        for core in cores:
+            parent = top_parent(core) if core.type in TABLE_TYPES else None
+            if parent is None:
+                collapsed.append(core)
+            else:
+                partitions[parent].append([core.name, core.partition_bound])
+
+        for index, core in enumerate(collapsed):
+            if core.type in TABLE_TYPES and core.name in partitions:
+                # Cores are shared with the parse cache, so never modify them
+                core = SimpleNamespace(**vars(core))
+                core.partitions = partitions[core.name]
+                collapsed[index] = core
+        return collapsed
+
+    def infer_dependencies(self, cores, known_cores):
+        """List the documented objects referenced in each object body.
+
+        Bodies stored by :meth:`parse_core_text` are scanned, without their
+        comments and string literals, for the ``schema.object`` names of
+        all ``known_cores`` (including partitions collapsed out of
+        ``cores``) with one :class:`NameMatcher`. Objects referencing others get (copied, as
+        cores are shared with the parse cache) an ``inferred_dependencies``
+        list of [type, name, declared] rows, where declared is "yes" when
+        the name is also in the header's dependant objects and "MISSING"
+        otherwise.
+        """
+        types = {core.name: core.type for core in known_cores if "." in core.name}
+        matcher = NameMatcher(types)
+
+        inferred = []
+        for core in cores:
+            body = getattr(core, "body", None)
+            if body is None:
+                inferred.append(core)
+                continue
+            body = self.mask_sql_noise(body).lower().replace('"', "")
+            found = sorted(matcher.find(body) - {core.name})
+            core = SimpleNamespace(**vars(core))
+            del core.body
+            if found:
+                declared = {
+                    row[1].lower().replace('"', "")
+                    for row in getattr(core.comments, "dependencies", [])[1:]
+                    if len(row) > 1
+                }
+                core.inferred_dependencies = [
+                    [types[name], name, "yes" if name in declared else "MISSING"]
+                    for name in found
+                ]
+            inferred.append(core)
+        return inferred
+
+    def note_search_entries(self, env, cores):
+        """Record objects and their columns for the compact search index."""
+        entries = []
+        for core in cores:
+            anchor = n.make_id(core.name)
+            entries.append((core.name, core.name, anchor, core.type))
+            short_name = core.name.rsplit(".", 1)[-1]
+            if short_name != core.name:
+                entries.append((short_name, core.name, anchor, core.type))
+            for col in getattr(core, "cols", [])[1:]:
+                entries.append(
+                    (col[0], "{}.{}".format(core.name, col[0]), anchor, "COLUMN")
+                )
+            for name, _ in getattr(core, "partitions", []):
+                entries.append((name, name, anchor, "PARTITION"))
+                short_name = name.rsplit(".", 1)[-1]
+                if short_name != name:
+                    entries.append((short_name, name, anchor, "PARTITION"))
+
+        if not hasattr(env, "sphinxsql_search_entries"):
+            env.sphinxsql_search_entries = {}
+        env.sphinxsql_search_entries.setdefault(env.docname, []).extend(entries)
+
     def run(self):
         # Read configuration variables from BuildEnvironment
         env = self.state.document.settings.env
@@ -552,22 +1424,103 @@ class SqlDirective(Directive):
         doc_cores = []
         sql_argument = self.options["sqlsource"]
         srcdir = self.get_sql_dir(sqlsrc=sql_argument)
-        sql_files = self.get_sql_files(srcpath=srcdir)
 
-        # Extract doc strings from source files
-        for file in sql_files:
-            logger.debug("File: {}".format(file))
-            core = self.extract_core_text(config, file)
+        # Parse results from earlier builds, keyed by source root and
+        # options, then file
+        if not hasattr(env, "sphinxsql_parse_cache"):
+            env.sphinxsql_parse_cache = {}
+        cache_key = self.get_parse_cache_key(config, srcdir)
+        cache = env.sphinxsql_parse_cache.get(cache_key, {})
+        new_cache = {}
+        is_archive = self.is_sql_archive(srcdir)
+        if is_archive:
+            env.note_dependency(str(srcdir))
+
+        self.issues = []
+        if config.sphinxsql_parse_timeout is not None:
+            self.watchdog = ParseWatchdog(
+                config, config.sphinxsql_parse_timeout, self.report_issue
+            )
+        if not hasattr(env, "sphinxsql_skipped"):
+            env.sphinxsql_skipped = {}
+        skipped = env.sphinxsql_skipped.setdefault(env.docname, [])
 
-            if not core:
-                logger.warning(
-                    f"Did not find usable sphinx-sql comments in file: {file}"
-                )
-            else:
-                doc_cores.append(core)
+        sources = self.get_sql_sources(srcdir)
+        if is_archive:
+            length = self.count_sql_archive_members(srcdir)
+        else:
+            sources = list(sources)
+            length = len(sources)
+            # New files have no dependency entry, see find_outdated_docs()
+            if not hasattr(env, "sphinxsql_sources"):
+                env.sphinxsql_sources = {}
+            env.sphinxsql_sources.setdefault(env.docname, []).append(
+                (str(srcdir), sorted(str(source[0]) for source in sources))
+            )
+
+        if length is None:
+            # Without a length status_iterator logs every member, so tar
+            # archives get a single summary line instead
+            progress = sources
+        else:
+            progress = status_iterator(
+                sources,
+                "reading sql sources... ",
+                "purple",
+                length,
+                env.app.verbosity,
+                stringify_func=lambda source: str(source[0]),
+            )
+
+        # Extract doc strings from source files
+        count = 0
+        try:
+            for file, key, read in progress:
+                count += 1
+                if not is_archive:
+                    env.note_dependency(str(file))
+                try:
+                    core = self.get_cached_core_text(
+                        config, file, key, read, cache, new_cache
+                    )
+                except ParseBudgetExceeded as e:
+                    self.report_issue(
+                        "parse_budget",
+                        file,
+                        f"Skipping {file}: {e.reason} exceeded during {e.phase}",
+                    )
+                    skipped.append((str(file), e.phase, e.reason))
+                    continue
+
+                if not core:
+                    if new_cache[str(file)][3]:
+                        # Only COMMENT ON statements, see join_comment_index()
+                        continue
+                    self.report_issue(
+                        "no_comments",
+                        file,
+                        f"Did not find usable sphinx-sql comments in file: {file}",
+                    )
+                else:
+                    doc_cores.append(core)
+        finally:
+            if self.watchdog is not None:
+                self.watchdog.close()
+        if length is None:
+            logger.info("reading sql sources... read %d files from %s", count, srcdir)
 
         # Sort docs into SQL object type and alphabetic object name
         sorted_cores = sorted(doc_cores, key=lambda x: (x.type, x.name))
+        known_cores = sorted_cores
+        sorted_cores = self.collapse_partitions(sorted_cores)
+        sorted_cores = self.join_comment_index(
+            sorted_cores, self.build_comment_index(new_cache)
+        )
+        if config.sphinxsql_infer_dependencies:
+            sorted_cores = self.infer_dependencies(sorted_cores, known_cores)
+
+        if config.sphinxsql_compact_search_index:
+            self.note_search_entries(env, sorted_cores)
 
         # Extract docutil nodes into lists of SQL object type
         section_types = defaultdict(list)
@@ -584,11 +1537,360 @@ class SqlDirective(Directive):
 
             # Append to master node list for return
             sections.append(top_section)
+
+        env.sphinxsql_parse_cache[cache_key] = new_cache
+
+        self.summarize_issues()
+        if not hasattr(env, "sphinxsql_issues"):
+            env.sphinxsql_issues = {}
+        env.sphinxsql_issues.setdefault(env.docname, []).extend(self.issues)
         return sections
 
 
+class NameMatcher:
+    """Find known object names in SQL text (Aho-Corasick automaton).
+
+    Building the automaton is linear in the total length of the names, and
+    a scan is linear in the length of the text plus the number of matches,
+    however many names there are. Names and text are matched as given, so
+    both should be lower case.
+    """
+
+    # Characters that continue an identifier
+    identifier = set("abcdefghijklmnopqrstuvwxyz0123456789_$")
+
+    def __init__(self, names):
+        # Per state: transitions, failure link, name ending here, and the
+        # nearest state on the failure chain where a name ends
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [None]
+        self.output_link = [0]
+        for name in names:
+            state = 0
+            for char in name:
+                if char not in self.goto[state]:
+                    self.goto[state][char] = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(None)
+                    self.output_link.append(0)
+                state = self.goto[state][char]
+            self.output[state] = name
+
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(char, 0)
+                self.fail[child] = fail
+                self.output_link[child] = (
+                    fail if self.output[fail] else self.output_link[fail]
+                )
+
+    def find(self, text):
+        """Return the set of names found in `text` as whole identifiers.
+
+        A name preceded by an identifier character or a dot is part of a
+        longer name and does not count; one followed by a dot does (a
+        column reference such as ``schema.table.column``).
+        """
+        found = set()
+        goto, fail, output, output_link = (
+            self.goto, self.fail, self.output, self.output_link
+        )
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            match = state if output[state] else output_link[state]
+            while match:
+                name = output[match]
+                start = end - len(name)
+                before = text[start - 1] if start else " "
+                after = text[end] if end < len(text) else " "
+                if (
+                    before not in self.identifier
+                    and before != "."
+                    and after not in self.identifier
+                ):
+                    found.add(name)
+                match = output_link[match]
+        return found
+
+
+class WorkerLogHandler(pylogging.Handler):
+    """Send log records from a parse worker back through its pipe."""
+
+    def __init__(self, conn):
+        super().__init__()
+        self.conn = conn
+
+    def emit(self, record):
+        self.conn.send(("log", (record.levelno, record.getMessage())))
+
+
+def parse_worker(conn, config):
+    """Worker process loop for :class:`ParseWatchdog`.
+
+    Receives ``(contents, file)`` jobs, reports each phase as it starts and
+    sends back the parsed object. A None job ends the loop. Log records are
+    forwarded to the parent, which owns the Sphinx log output.
+    """
+    # The parsing helpers don't use any directive state
+    parser = SqlDirective.__new__(SqlDirective)
+    parser.report_phase = lambda phase: conn.send(("phase", phase))
+    parser.report_issue = lambda *issue: conn.send(("issue", issue))
+    forward = WorkerLogHandler(conn)
+    logger.logger.handlers = [forward]
+    logger.logger.propagate = False
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        contents, file = job
+        conn.send(("done", parser.parse_core_text(config, contents, file)))
+
+
+class ParseWatchdog:
+    """Parse files in a worker process that is killed when over budget.
+
+    Regex matching cannot be interrupted from within the interpreter, so a
+    pathological file can only be stopped by terminating the process that
+    parses it. A fresh worker is started for the next file.
+    """
+
+    def __init__(self, config, timeout, report_issue):
+        # Only plain settings cross the process boundary
+        self.config = SimpleNamespace(
+            sphinxsql_include_table_attributes=config.sphinxsql_include_table_attributes,
+            sphinxsql_infer_dependencies=config.sphinxsql_infer_dependencies,
+        )
+        self.timeout = timeout
+        self.report_issue = report_issue
+        self.process = None
+        self.conn = None
+
+    def start(self):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=parse_worker, args=(child_conn, self.config), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def stop(self):
+        if self.process is None:
+            return
+        self.process.terminate()
+        self.process.join()
+        self.conn.close()
+        self.process = None
+        self.conn = None
+
+    def close(self):
+        if self.process is not None and self.process.is_alive():
+            self.conn.send(None)
+            self.process.join(self.timeout)
+        self.stop()
+
+    def parse(self, contents, file):
+        if self.process is None or not self.process.is_alive():
+            self.start()
+
+        self.conn.send((contents, str(file)))
+        phase = "startup"
+        deadline = time.monotonic() + self.timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                ready = remaining > 0 and self.conn.poll(remaining)
+                if ready:
+                    kind, value = self.conn.recv()
+            except EOFError:
+                # The worker died, let the next file start a new one
+                self.stop()
+                raise ParseBudgetExceeded(phase, "worker crash")
+            if not ready:
+                self.stop()
+                raise ParseBudgetExceeded(phase, f"{self.timeout}s timeout")
+            if kind == "done":
+                return value
+            elif kind == "issue":
+                self.report_issue(*value)
+            elif kind == "log":
+                logger.log(*value)
+            else:
+                phase = value
+
+
+def search_shard_name(term):
+    """Return the shard file stem for a search term.
+
+    Must stay in sync with ``shardName`` in ``static/sphinxsql_search.js``.
+    """
+    return re.sub(r"[^a-z0-9_]", "_", term[:SEARCH_SHARD_PREFIX].lower()) or "_"
+
+
+# Environment attributes holding per-document data, keyed by docname
+DOC_ENV_ATTRIBUTES = (
+    "sphinxsql_search_entries",
+    "sphinxsql_skipped",
+    "sphinxsql_issues",
+    "sphinxsql_sources",
+)
+
+
+def purge_doc_entries(app, env, docname):
+    for attr in DOC_ENV_ATTRIBUTES:
+        if hasattr(env, attr):
+            getattr(env, attr).pop(docname, None)
+
+
+def merge_doc_entries(app, env, docnames, other):
+    for attr in DOC_ENV_ATTRIBUTES:
+        if not hasattr(other, attr):
+            continue
+        if not hasattr(env, attr):
+            setattr(env, attr, {})
+        for docname in docnames:
+            if docname in getattr(other, attr):
+                getattr(env, attr)[docname] = getattr(other, attr)[docname]
+
+
+def find_outdated_docs(app, env, added, changed, removed):
+    """Return the documents whose sqlsource tree gained or lost .sql files.
+
+    Changes to known files are tracked with ``env.note_dependency``, but a
+    new file (e.g. one holding only COMMENT ON statements) has no entry
+    that could mark the document outdated.
+    """
+    outdated = []
+    for docname, sources in getattr(env, "sphinxsql_sources", {}).items():
+        if docname in removed:
+            continue
+        for srcdir, files in sources:
+            current = sorted(str(file) for file in Path(srcdir).rglob("*.sql"))
+            if current != files:
+                outdated.append(docname)
+                break
+    return outdated
+
+
+def merge_parse_cache(app, env, docnames, other):
+    if not hasattr(other, "sphinxsql_parse_cache"):
+        return
+    if not hasattr(env, "sphinxsql_parse_cache"):
+        env.sphinxsql_parse_cache = {}
+    env.sphinxsql_parse_cache.update(other.sphinxsql_parse_cache)
+
+
+def init_static_files(app):
+    """Add the scripts of the enabled client side features."""
+    if app.builder.format != "html":
+        return
+    scripts = []
+    if app.config.sphinxsql_compact_search_index:
+        scripts.append("sphinxsql_search.js")
+    if app.config.sphinxsql_lazy_details and app.builder.name in LAZY_DETAILS_BUILDERS:
+        scripts.append("sphinxsql_details.js")
+    if scripts:
+        app.config.html_static_path.append(str(Path(__file__).parent / "static"))
+    for script in scripts:
+        app.add_js_file(script)
+
+
+def write_search_shards(app, exception):
+    """Write the compact search index as one JSON file per name prefix.
+
+    Each shard maps a lower-cased object or column name to a list of
+    ``[title, uri, type]`` entries. A manifest lists the shard names, for
+    lookups of terms shorter than the shard prefix.
+    """
+    if exception or not app.config.sphinxsql_compact_search_index:
+        return
+    if app.builder.format != "html":
+        return
+
+    shards = defaultdict(lambda: defaultdict(list))
+    entries = getattr(app.env, "sphinxsql_search_entries", {})
+    for docname in sorted(entries):
+        uri = app.builder.get_target_uri(docname)
+        for term, title, anchor, obj_type in entries[docname]:
+            term = term.lower()
+            shards[search_shard_name(term)][term].append(
+                [title, "{}#{}".format(uri, anchor), obj_type]
+            )
+
+    outdir = Path(app.outdir, "_static", "sphinxsql")
+    outdir.mkdir(parents=True, exist_ok=True)
+    for stale in outdir.glob("*.json"):
+        stale.unlink()
+    for shard, index in shards.items():
+        with open(outdir / "{}.json".format(shard), "w") as f:
+            json.dump(index, f, separators=(",", ":"))
+    with open(outdir / "{}.json".format(SEARCH_SHARD_MANIFEST), "w") as f:
+        json.dump(sorted(shards), f, separators=(",", ":"))
+
+
+def report_skipped_files(app, exception):
+    """Print a summary table of the files skipped for exceeding a budget."""
+    skipped = [
+        row
+        for docname, rows in sorted(getattr(app.env, "sphinxsql_skipped", {}).items())
+        for row in rows
+    ]
+    if exception or not skipped:
+        return
+
+    header = ("File", "Phase", "Budget")
+    widths = [max(len(row[i]) for row in [header, *skipped]) for i in range(3)]
+    line = "-+-".join("-" * width for width in widths)
+    lines = [f"sphinx-sql skipped {len(skipped)} file(s) over budget:", line]
+    for row in [header, *skipped]:
+        cells = (cell.ljust(width) for cell, width in zip(row, widths))
+        lines.append(" | ".join(cells).rstrip())
+        if row is header:
+            lines.append(line)
+    logger.info("\n".join(lines))
+
+
+def write_issue_log(app, exception):
+    """Write every collected warning to ``sphinxsql_log_file`` as JSON lines."""
+    if not app.config.sphinxsql_log_file:
+        return
+
+    log_file = Path(app.outdir, app.config.sphinxsql_log_file)
+    log_file.parent.mkdir(parents=True, exist_ok=True)
+    issues = getattr(app.env, "sphinxsql_issues", {})
+    with open(log_file, "w") as f:
+        for docname in sorted(issues):
+            for category, source, message in issues[docname]:
+                record = {
+                    "docname": docname,
+                    "category": category,
+                    "source": source,
+                    "message": message,
+                }
+                f.write(json.dumps(record) + "\n")
+
+
 def setup(app):
     app.add_directive("autosql", SqlDirective)
+    app.add_node(sql_table, html=(visit_sql_table_html, None))
+    app.add_post_transform(SqlTableTransform)
+    app.connect("env-purge-doc", purge_doc_entries)
+    app.connect("env-merge-info", merge_doc_entries)
+    app.connect("env-merge-info", merge_parse_cache)
+    app.connect("env-get-outdated", find_outdated_docs)
+    app.connect("builder-inited", init_static_files)
+    app.connect("build-finished", write_search_shards)
+    app.connect("build-finished", report_skipped_files)
+    app.connect("build-finished", write_issue_log)
     for name, (default, rebuild) in Config._config_values.items():
         app.add_config_value(name, default, rebuild)
     return {
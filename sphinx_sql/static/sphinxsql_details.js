@@ -0,0 +1,91 @@
+/*
+ * sphinxsql_details.js
+ * ~~~~~~~~~~~~~~~~~~~~
+ *
+ * Load the sphinx-sql detail tables (parameters, attributes, change log)
+ * of an object when its placeholder is expanded.
+ *
+ * Each object has one JSON file (_static/sphinxsql_details/<doc>/<id>.json)
+ * mapping the table kind to {header, rows}; it is fetched once, the first
+ * time any of its tables is opened.
+ */
+"use strict";
+
+const SphinxSQLDetails = (() => {
+  const files = new Map();
+
+  const contentRoot = () => {
+    const root = document.documentElement.dataset.content_root;
+    if (root !== undefined) return root;
+    if (typeof DOCUMENTATION_OPTIONS !== "undefined") {
+      return DOCUMENTATION_OPTIONS.URL_ROOT || "";
+    }
+    return "";
+  };
+
+  const loadFile = (src) => {
+    if (!files.has(src)) {
+      files.set(
+        src,
+        fetch(contentRoot() + src).then((response) => {
+          if (!response.ok) throw new Error(`${src}: ${response.status}`);
+          return response.json();
+        })
+      );
+    }
+    return files.get(src);
+  };
+
+  // Same markup as visit_sql_table_html()
+  const buildTable = ({ header, rows }) => {
+    const table = document.createElement("table");
+    table.className = "docutils align-default";
+    const head = table.createTHead().insertRow();
+    head.className = "row-odd";
+    header.forEach((title) => {
+      const th = document.createElement("th");
+      th.className = "head";
+      const para = document.createElement("p");
+      para.textContent = title;
+      th.appendChild(para);
+      head.appendChild(th);
+    });
+    const body = table.createTBody();
+    rows.forEach((row, ridx) => {
+      const tr = body.insertRow();
+      tr.className = ridx % 2 ? "row-odd" : "row-even";
+      row.forEach((cell) => {
+        tr.insertCell().textContent = cell;
+      });
+    });
+    return table;
+  };
+
+  const expand = (details) => {
+    if (details.dataset.loaded) return;
+    details.dataset.loaded = "true";
+    loadFile(details.dataset.src)
+      .then((tables) => {
+        const data = tables[details.dataset.kind];
+        if (data) details.appendChild(buildTable(data));
+      })
+      .catch((error) => {
+        delete details.dataset.loaded;
+        files.delete(details.dataset.src);
+        console.error("sphinx-sql:", error);
+      });
+  };
+
+  const init = () => {
+    document.querySelectorAll("details.sphinxsql-details").forEach((details) => {
+      details.addEventListener("toggle", () => {
+        if (details.open) expand(details);
+      });
+      if (details.open) expand(details);
+    });
+  };
+
+  return { init };
+})();
+
+document.addEventListener("DOMContentLoaded", SphinxSQLDetails.init);
@@ -0,0 +1,114 @@
+/*
+ * sphinxsql_search.js
+ * ~~~~~~~~~~~~~~~~~~~
+ *
+ * Client side lookup for the compact sphinx-sql search index.
+ *
+ * The index is split into JSON shards by name prefix
+ * (_static/sphinxsql/<prefix>.json), so a lookup only fetches the one
+ * shard its term falls into. Terms shorter than the prefix fan out to every
+ * shard starting with them, as listed in _static/sphinxsql/shards.json.
+ */
+"use strict";
+
+const SphinxSQL = (() => {
+  // Must stay in sync with SEARCH_SHARD_PREFIX / search_shard_name()
+  const SHARD_PREFIX = 2;
+  // Must stay in sync with SEARCH_SHARD_MANIFEST
+  const SHARD_MANIFEST = "shards";
+  const shards = new Map();
+
+  const contentRoot = () => {
+    const root = document.documentElement.dataset.content_root;
+    if (root !== undefined) return root;
+    if (typeof DOCUMENTATION_OPTIONS !== "undefined") {
+      return DOCUMENTATION_OPTIONS.URL_ROOT || "";
+    }
+    return "";
+  };
+
+  const shardName = (term) =>
+    term.slice(0, SHARD_PREFIX).toLowerCase().replace(/[^a-z0-9_]/g, "_") ||
+    "_";
+
+  const loadShard = (name, fallback = {}) => {
+    if (!shards.has(name)) {
+      const url = `${contentRoot()}_static/sphinxsql/${name}.json`;
+      shards.set(
+        name,
+        fetch(url)
+          .then((response) => (response.ok ? response.json() : fallback))
+          .catch(() => fallback)
+      );
+    }
+    return shards.get(name);
+  };
+
+  // Indexes of every shard the term's names can be in
+  const loadShards = (term) => {
+    const name = shardName(term);
+    if (term.length >= SHARD_PREFIX) {
+      return loadShard(name).then((index) => [index]);
+    }
+    return loadShard(SHARD_MANIFEST, []).then((manifest) =>
+      Promise.all(
+        manifest
+          .filter((shard) => shard.startsWith(name))
+          .map((shard) => loadShard(shard))
+      )
+    );
+  };
+
+  /**
+   * Resolve to a list of [title, uri, type] entries for every object or
+   * column name starting with ``term``.
+   */
+  const lookup = (term) => {
+    term = term.trim().toLowerCase();
+    if (!term) return Promise.resolve([]);
+    return loadShards(term).then((indexes) => {
+      const index = Object.assign({}, ...indexes);
+      const results = [];
+      Object.keys(index)
+        .filter((name) => name.startsWith(term))
+        .sort()
+        .forEach((name) => results.push(...index[name]));
+      return results;
+    });
+  };
+
+  const showResults = () => {
+    const target = document.getElementById("search-results");
+    const query = new URLSearchParams(window.location.search).get("q");
+    if (!target || !query) return;
+
+    const terms = query.split(/\s+/).filter((term) => term.length > 0);
+    Promise.all(terms.map(lookup)).then((found) => {
+      const results = found.flat();
+      if (!results.length) return;
+
+      const container = document.createElement("div");
+      container.id = "sphinxsql-search-results";
+      const heading = document.createElement("h2");
+      heading.textContent = "SQL Objects";
+      const list = document.createElement("ul");
+      list.className = "search";
+      results.forEach(([title, uri, type]) => {
+        const item = document.createElement("li");
+        const link = document.createElement("a");
+        link.href = contentRoot() + uri;
+        link.textContent = title;
+        item.appendChild(link);
+        item.appendChild(document.createTextNode(` (${type.toLowerCase()})`));
+        list.appendChild(item);
+      });
+      container.appendChild(heading);
+      container.appendChild(list);
+      target.parentNode.insertBefore(container, target);
+    });
+  };
+
+  return { lookup, showResults };
+})();
+
+document.addEventListener("DOMContentLoaded", SphinxSQL.showResults);
@@ -0,0 +1,11 @@
+/*
+Purpose:
+Daily sales, partitioned by month.
+ChangeLog:
+	Date    |    Author    |    Ticket    |    Modification
+	2021-02-01    |  Developer_2  |   T-301    |    Initial Definition
+*/
+CREATE TABLE schema4.sales (
+    sale_date date NOT NULL,
+    amount numeric(10,2)
+) PARTITION BY RANGE (sale_date);
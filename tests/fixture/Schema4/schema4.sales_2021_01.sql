@@ -0,0 +1,6 @@
+/*
+Purpose:
+Sales of January 2021.
+*/
+CREATE TABLE schema4.sales_2021_01 PARTITION OF schema4.sales
+    FOR VALUES FROM ('2021-01-01') TO ('2021-02-01');
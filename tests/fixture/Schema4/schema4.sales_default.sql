@@ -0,0 +1,10 @@
+/*
+Purpose:
+Sales outside of the monthly partitions.
+*/
+CREATE TABLE schema4.sales_default (
+    sale_date date NOT NULL,
+    amount numeric(10,2)
+);
+
+ALTER TABLE ONLY schema4.sales ATTACH PARTITION schema4.sales_default DEFAULT;
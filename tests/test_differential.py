@@ -0,0 +1,383 @@
+"""Differential tests between the legacy regex pipeline and faster parsers.
+
+``LegacySqlDirective`` pins the original implementation of every
+extraction or rendering step that has been replaced by an optimized one.
+Each corpus file is parsed by both, and the object models and the
+serialized docutils output (compact tables expanded, as non-HTML builders
+get them) must match exactly. The report also gives the relative speed of the
+two paths (shown with ``pytest -s``).
+
+When another extraction step gets an optimized implementation, move its
+regex version into ``LegacySqlDirective`` so it keeps being compared.
+"""
+import random
+import re
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+import docutils.nodes as n
+
+from sphinx_sql.sphinx_sql import SqlDirective, expand_sql_table, sql_table
+
+FIXTURE_DIR = Path(__file__).parent / "fixture"
+
+CONFIG = SimpleNamespace(
+    sphinxsql_include_table_attributes=True,
+    sphinxsql_parse_timeout=None,
+    sphinxsql_max_file_size=None,
+    sphinxsql_infer_dependencies=False,
+)
+
+
+CLOSING_REGEX = (
+    r"((?=return:)|(?=purpose:)|(?=dependent objects:)|"
+    r"(?=changelog:)|(?=parameters)|(?=\*/))"
+)
+
+
+class LegacySqlDirective(SqlDirective):
+    """The reference regex pipeline and docutils table builder."""
+
+    objname = re.compile(r"(?<=Object Name:)(\s\S*)", re.IGNORECASE | re.MULTILINE)
+    objtype = re.compile(r"(?<=Object Type:)(\s\S*)", re.IGNORECASE | re.MULTILINE)
+    objpara = re.compile(
+        rf"(?s)(?<=parameters:)(.*?){CLOSING_REGEX}", re.IGNORECASE | re.MULTILINE
+    )
+    objreturn = re.compile(r"Return:(.?\w.*)", re.IGNORECASE | re.MULTILINE)
+    objpurpose = re.compile(
+        rf"(?s)(?<=purpose:)(.*?){CLOSING_REGEX}", re.IGNORECASE | re.MULTILINE
+    )
+    objdepen = re.compile(
+        rf"(?s)(?<=objects:)(.*?){CLOSING_REGEX}", re.IGNORECASE | re.MULTILINE
+    )
+    objchange = re.compile(
+        rf"(?s)(?<=changelog:)(.*?){CLOSING_REGEX}", re.IGNORECASE | re.MULTILINE
+    )
+
+    def parse_header(self, str_comment):
+        header = self.extract_comments(str_comment)
+        oname = self.objname.search(str_comment)
+        otype = self.objtype.search(str_comment)
+        if oname:
+            header["object_name"] = oname[0]
+        if otype:
+            header["object_type"] = otype[0]
+        return header
+
+    def extract_comments(self, str_comment):
+        obj_comment = {}
+        if self.objpara.findall(str_comment):
+            sparam = self.objpara.findall(str_comment)[0]
+            obj_comment["param"] = self.split_to_list(sparam)
+        if self.objreturn.findall(str_comment):
+            obj_comment["return_type"] = (
+                str(self.objreturn.findall(str_comment)[0]).lower().strip()
+            )
+        if self.objpurpose.findall(str_comment):
+            obj_comment["purpose"] = str(
+                self.objpurpose.findall(str_comment)[0][0]
+            ).strip()
+        if self.objdepen.findall(str_comment):
+            sod = self.objdepen.findall(str_comment)[0]
+            obj_comment["dependencies"] = self.split_to_list(sod)
+        if self.objchange.findall(str_comment):
+            scl = self.objchange.findall(str_comment)[0]
+            obj_comment["changelog"] = self.split_to_list(scl)
+
+        return obj_comment
+
+    def split_to_list(self, source):
+        slist = []
+        source = "".join(source)
+        source = [x.strip() for x in source.splitlines()]
+        for line in self.non_blank_lines(source):
+            sline = [x.strip() for x in line.split("|")]
+            slist.append(sline)
+        return slist
+
+    def non_blank_lines(self, f):
+        for vline in f:
+            line = vline.rstrip()
+            if line:
+                yield line
+
+    def build_table(self, titles, tabledata, is_dependant=False, kind=""):
+        table = n.table()
+        tgroup = n.tgroup()
+        tbody = n.tbody()
+
+        for _ in range(len(tabledata[0])):
+            colspec = n.colspec(colwidth=1)
+            tgroup += colspec
+
+        for tidx, row in enumerate(tabledata):
+            header = n.row()
+            for title in titles:
+                header += n.entry("", n.paragraph(text=title))
+            r = n.row()
+            for cidx, cell in enumerate(row):
+                entry = n.entry()
+                if is_dependant and tidx >= 0 and cidx == 1:
+                    para = n.paragraph()
+                    entry += para
+                    para += n.reference(
+                        cell, cell, refuri="#{}".format(n.make_id(cell))
+                    )
+                else:
+                    entry += n.Text(cell)
+
+                r += entry
+            tbody += r
+        tgroup += n.thead("", header)
+        tgroup += tbody
+        table += tgroup
+        return table
+
+
+def new_parser(cls):
+    return cls(None, None, None, None, None, None, None, None, None)
+
+
+def to_plain(value):
+    """Turn a parsed object model into plain, comparable data."""
+    if isinstance(value, SimpleNamespace):
+        return {key: to_plain(item) for key, item in vars(value).items()}
+    if isinstance(value, (list, tuple)):
+        return [to_plain(item) for item in value]
+    return value
+
+
+def serialize(parser, core):
+    """Render `core` the way non-HTML builders see it.
+
+    Compact :class:`sql_table` nodes are expanded like the post-transform
+    does, so they are compared against the legacy docutils tables.
+    """
+    if core is None:
+        return None
+    try:
+        section = parser.build_docutil_node(core)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    for node in list(section.findall(sql_table)):
+        node.replace_self(expand_sql_table(node))
+    return section.pformat()
+
+
+def run_parser(parser, corpus):
+    """Parse and render the corpus, returning results and elapsed seconds."""
+    results = []
+    elapsed = 0.0
+    for name, contents in corpus:
+        start = time.perf_counter()
+        try:
+            core = parser.parse_core_text(CONFIG, contents, name)
+        except Exception as e:
+            core = f"{type(e).__name__}: {e}"
+        elapsed += time.perf_counter() - start
+        if isinstance(core, str):
+            results.append((core, None))
+        else:
+            results.append((to_plain(core), serialize(parser, core)))
+    return results, elapsed
+
+
+def compare(reference, candidate, corpus):
+    """Run both parsers over `corpus` and report where they diverge.
+
+    Returns a namespace with the list of ``divergences`` (file name, what
+    differs, reference value, candidate value) and the time each parser
+    took.
+    """
+    expected, reference_time = run_parser(reference, corpus)
+    actual, candidate_time = run_parser(candidate, corpus)
+
+    divergences = []
+    for (name, _), (ref_model, ref_doc), (cand_model, cand_doc) in zip(
+        corpus, expected, actual
+    ):
+        if ref_model != cand_model:
+            divergences.append((name, "object model", ref_model, cand_model))
+        elif ref_doc != cand_doc:
+            divergences.append((name, "docutils output", ref_doc, cand_doc))
+
+    return SimpleNamespace(
+        divergences=divergences,
+        reference_time=reference_time,
+        candidate_time=candidate_time,
+        files=len(corpus),
+    )
+
+
+def format_report(report):
+    speedup = report.reference_time / max(report.candidate_time, 1e-9)
+    lines = [
+        f"{report.files} files, legacy {report.reference_time:.3f}s, "
+        f"current {report.candidate_time:.3f}s ({speedup:.2f}x)"
+    ]
+    for name, what, expected, actual in report.divergences[:10]:
+        lines.append(f"{name}: {what} differs")
+        lines.append(f"  legacy:  {expected!r}")
+        lines.append(f"  current: {actual!r}")
+    if len(report.divergences) > 10:
+        lines.append(f"... {len(report.divergences) - 10} more divergences")
+    return "\n".join(lines)
+
+
+def check(corpus, verbose=True):
+    report = compare(new_parser(LegacySqlDirective), new_parser(SqlDirective), corpus)
+    if verbose:
+        print("\n" + format_report(report))
+    assert not report.divergences, format_report(report)
+
+
+# Generated corpus
+
+WORDS = [
+    "load", "daily", "sales", "customer", "rows", "from", "the", "staging",
+    "area", "into", "fact", "tables", "and", "rebuild", "indexes", "-", "*",
+    "(see", "T-100)", "a", "b", "c", "on", "error", "rollback.",
+]
+KEYWORDS = {
+    "parameters": ["Parameters:", "PARAMETERS:", "parameters:"],
+    "return": ["Return:", "RETURN:", "return:"],
+    "purpose": ["Purpose:", "PURPOSE:", "purpose:"],
+    "dependencies": ["Dependent Objects:", "DEPENDENT OBJECTS:"],
+    "changelog": ["ChangeLog:", "CHANGELOG:", "changelog:"],
+}
+
+
+def words(rng, count):
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+def indent(rng):
+    return rng.choice(["", "    ", "\t", "  "])
+
+
+def pipe_rows(rng, header, rows, cell):
+    lines = [indent(rng) + " | ".join(header)]
+    for _ in range(rows):
+        cells = [cell(rng) for _ in header]
+        sep = rng.choice(["|", " | ", "  |\t"])
+        lines.append(indent(rng) + sep.join(cells))
+        if rng.random() < 0.1:
+            lines.append("")
+    return lines
+
+
+def header_comment(rng, text=None):
+    sections = list(KEYWORDS)
+    rng.shuffle(sections)
+    lines = ["/*"]
+    if rng.random() < 0.2:
+        lines += ["Object Name: my_schema.dml_{}".format(rng.randint(0, 99))]
+        lines += ["Object Type: DML"]
+    for section in sections[: rng.randint(0, len(sections))]:
+        keyword = rng.choice(KEYWORDS[section])
+        if section == "return":
+            lines.append(indent(rng) + keyword + " " + rng.choice(["Void", "bigint", "SETOF text"]))
+            continue
+        lines.append(indent(rng) + keyword)
+        if section == "purpose":
+            body = text if text is not None else "\n".join(
+                indent(rng) + words(rng, rng.randint(0, 12))
+                for _ in range(rng.randint(1, 5))
+            )
+            lines.append(body)
+        elif section == "parameters":
+            lines += pipe_rows(
+                rng, ["Name", "Type", "Description"], rng.randint(0, 4),
+                lambda r: words(r, r.randint(1, 3)),
+            )
+        elif section == "dependencies":
+            lines += pipe_rows(
+                rng, ["Type", "Name"], rng.randint(0, 4),
+                lambda r: "schema_{}.obj_{}".format(r.randint(0, 5), r.randint(0, 50)),
+            )
+        else:
+            lines += pipe_rows(
+                rng, ["Date", "Author", "Ticket", "Modification"],
+                rng.randint(0, 30), lambda r: words(r, r.randint(1, 6)),
+            )
+        if rng.random() < 0.3:
+            lines.append("")
+    lines.append(rng.choice(["*/", "    */"]))
+    return "\n".join(lines)
+
+
+def object_ddl(rng, number):
+    kind = rng.choice(["table", "view", "function", "procedure", "dml"])
+    name = "my_schema.obj_{}".format(number)
+    if kind == "table":
+        columns = ",\n".join(
+            "    col_{} {}".format(i, rng.choice(["bigint", "text", "varchar(20)", "numeric(10,2)"]))
+            for i in range(rng.randint(1, 6))
+        )
+        return f"CREATE TABLE {name} (\n{columns}\n)\nDISTRIBUTED BY (col_0);\n"
+    if kind == "view":
+        return f"CREATE OR REPLACE VIEW {name} AS\nSELECT * FROM my_schema.src;\n"
+    if kind in {"function", "procedure"}:
+        return (
+            f"CREATE OR REPLACE {kind.upper()} {name}(debug BOOLEAN) RETURNS void\n"
+            "AS $BODY$\nBEGIN\n    SELECT 1;\nEND;\n$BODY$\nLANGUAGE plpgsql;\n"
+        )
+    return "DELETE FROM my_schema.src;\n"
+
+
+def generate_sql(rng, number, text=None):
+    return header_comment(rng, text) + "\n" + object_ddl(rng, number)
+
+
+def fixture_corpus():
+    return [
+        (str(path.relative_to(FIXTURE_DIR)), path.read_text())
+        for path in sorted(FIXTURE_DIR.rglob("*.sql"))
+    ]
+
+
+def generated_corpus(seed, size):
+    rng = random.Random(seed)
+    return [("generated_{}.sql".format(i), generate_sql(rng, i)) for i in range(size)]
+
+
+def test_fixture_corpus():
+    check(fixture_corpus())
+
+
+def test_generated_corpus():
+    check(generated_corpus(seed=20201028, size=300))
+
+
+def test_property_based_corpus():
+    hypothesis = pytest.importorskip("hypothesis")
+    st = pytest.importorskip("hypothesis.strategies")
+
+    free_text = st.text(
+        alphabet=st.sampled_from("abcxyz ABC|-_.:;*/\t\n0123456789"), max_size=200
+    )
+
+    @hypothesis.settings(max_examples=200, deadline=None)
+    @hypothesis.given(st.randoms(use_true_random=False), free_text)
+    def parse_both(rng, text):
+        check([("hypothesis.sql", generate_sql(rng, 0, text))], verbose=False)
+
+    parse_both()
+
+
+def test_large_changelog_benchmark():
+    rng = random.Random(20201028)
+    changelog = pipe_rows(
+        rng, ["Date", "Author", "Ticket", "Modification"], 5000,
+        lambda r: words(r, r.randint(1, 6)),
+    )
+    header = "\n".join(
+        ["/*", "Purpose:", "    Long lived view.", "Dependent Objects:",
+         "    Type | Name", "    Table | my_schema.src", "ChangeLog:"]
+        + changelog + ["*/"]
+    )
+    sql = header + "\nCREATE OR REPLACE VIEW my_schema.history AS\nSELECT 1;\n"
+    check([("large_changelog.sql", sql)])
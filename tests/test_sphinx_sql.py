@@ -1,6 +1,25 @@
+import json
+import multiprocessing
+import pickle
 import pytest
+import shutil
+import subprocess
+import time
 from types import SimpleNamespace
-from sphinx_sql.sphinx_sql import SqlDirective
+import docutils.nodes as n
+from sphinx_sql.sphinx_sql import (
+    NameMatcher,
+    ParseBudgetExceeded,
+    ParseWatchdog,
+    SqlDirective,
+    defer_detail_tables,
+    expand_sql_table,
+    find_outdated_docs,
+    search_shard_name,
+    sql_table,
+    visit_sql_table_html,
+    write_search_shards,
+)
 from unittest.mock import patch, mock_open
 
 
@@ -139,11 +158,16 @@ def dml_definition():
 
 @pytest.fixture
 def configuration():
-    conf = {"sphinxsql_include_table_attributes": True}
+    conf = {
+        "sphinxsql_include_table_attributes": True,
+        "sphinxsql_parse_timeout": None,
+        "sphinxsql_max_file_size": None,
+        "sphinxsql_infer_dependencies": False,
+    }
     return SimpleNamespace(**conf)
 
 
-def test_view_definitions(view_definition):
+def test_view_definitions(view_definition, configuration):
     view_text = view_definition
     with patch("builtins.open", mock_open(read_data=view_text)) as mock_file:
         s = SqlDirective(None, None, None, None, None, None, None, None, None)
@@ -152,7 +176,7 @@ def test_view_definitions(view_definition):
         assert section.children[0].rawsource == "myschema.myview"
 
 
-def test_function_definitions(function_definition):
+def test_function_definitions(function_definition, configuration):
     function_text = function_definition
     with patch("builtins.open", mock_open(read_data=function_text)) as mock_file:
         s = SqlDirective(None, None, None, None, None, None, None, None, None)
@@ -180,7 +204,7 @@ def test_function_definitions_no_dependents(
         assert len(contains_dependents) == 0
 
 
-def test_dml_definitions(dml_definition):
+def test_dml_definitions(dml_definition, configuration):
     dml_text = dml_definition
     with patch("builtins.open", mock_open(read_data=dml_text)) as mock_file:
         s = SqlDirective(None, None, None, None, None, None, None, None, None)
@@ -208,3 +232,482 @@ def test_table_node_colums_off(table_definition, configuration):
         section = s.build_docutil_node(core)
         assert section.children[0].rawsource == "myschema.mytable"
         assert section.children[6].rawsource == "CHANGE LOG:"
+
+
+def test_build_table_compact_node():
+    s = SqlDirective(None, None, None, None, None, None, None, None, None)
+    table = s.build_table(
+        ["Type", "Name"], [["Table", "my_schema.a<b>"], ["View", "my_schema.v"]], True
+    )
+    assert isinstance(table, sql_table)
+    assert table["rows"][0] == ("Table", "my_schema.a<b>")
+
+    translator = SimpleNamespace(body=[])
+    with pytest.raises(n.SkipNode):
+        visit_sql_table_html(translator, table)
+    html = "".join(translator.body)
+    assert "<th class=\"head\"><p>Name</p></th>" in html
+    assert "my_schema.a&lt;b&gt;</a>" in html
+    assert 'href="#my-schema-a-b"' in html
+
+    expanded = expand_sql_table(table)
+    assert isinstance(expanded, n.table)
+    rows = list(expanded.findall(n.row))
+    assert len(rows) == 3
+    assert len(list(expanded.findall(n.reference))) == 2
+
+
+def test_lazy_detail_tables(tmp_path, table_definition, configuration):
+    with patch("builtins.open", mock_open(read_data=table_definition)) as mock_file:
+        s = SqlDirective(None, None, None, None, None, None, None, None, None)
+        core = s.extract_core_text(config=configuration, file=mock_file)
+    section = s.build_docutil_node(core)
+    stale = tmp_path / "_static/sphinxsql_details/schema/index/old-object.json"
+    stale.parent.mkdir(parents=True)
+    stale.write_text("{}")
+
+    defer_detail_tables(section, "schema/index", tmp_path)
+
+    path = "_static/sphinxsql_details/schema/index/myschema-mytable.json"
+    tables = json.loads((tmp_path / path).read_text())
+    assert sorted(tables) == ["attributes", "changelog"]
+    assert tables["attributes"]["header"] == ["Name", "Type", "Description"]
+    assert not stale.exists()
+
+    lazy = [node for node in section.findall(sql_table) if node.get("details")]
+    assert [node["kind"] for node in lazy] == ["attributes", "changelog"]
+    translator = SimpleNamespace(body=[])
+    with pytest.raises(n.SkipNode):
+        visit_sql_table_html(translator, lazy[0])
+    html = "".join(translator.body)
+    assert 'data-src="{}" data-kind="attributes"'.format(path) in html
+    assert "<table" not in html
+
+
+def test_build_table_without_rows():
+    s = SqlDirective(None, None, None, None, None, None, None, None, None)
+    with pytest.raises(ValueError):
+        s.build_table(["Date", "Author"], [])
+
+
+def test_compact_search_entries(table_definition, configuration):
+    configuration.sphinxsql_include_table_attributes = True
+    with patch("builtins.open", mock_open(read_data=table_definition)) as mock_file:
+        s = SqlDirective(None, None, None, None, None, None, None, None, None)
+        core = s.extract_core_text(config=configuration, file=mock_file)
+        env = SimpleNamespace(docname="autosql")
+        s.note_search_entries(env, [core])
+        entries = env.sphinxsql_search_entries["autosql"]
+        assert ("myschema.mytable", "myschema.mytable", "myschema-mytable", "TABLE") in entries
+        assert ("mytable", "myschema.mytable", "myschema-mytable", "TABLE") in entries
+        assert ("l_name", "myschema.mytable.l_name", "myschema-mytable", "COLUMN") in entries
+        assert search_shard_name("myschema.mytable") == "my"
+        assert search_shard_name("A.b") == "a_"
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+def test_git_blob_ids(tmp_path, view_definition):
+    def git(*args):
+        subprocess.run(
+            ["git", "-c", "user.name=t", "-c", "user.email=t@t", *args],
+            cwd=tmp_path,
+            check=True,
+            capture_output=True,
+        )
+
+    git("init")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "clean.sql").write_text(view_definition)
+    (tmp_path / "changed.sql").write_text(view_definition)
+    git("add", ".")
+    git("commit", "-m", "init")
+    (tmp_path / "changed.sql").write_text(view_definition + "\n-- edit")
+    (tmp_path / "untracked.sql").write_text(view_definition)
+
+    s = SqlDirective(None, None, None, None, None, None, None, None, None)
+    blob_ids = s.get_git_blob_ids(tmp_path)
+    assert list(blob_ids) == [str(tmp_path / "sub" / "clean.sql")]
+
+    assert s.get_git_blob_ids(tmp_path / "sub") is not None
+    shutil.rmtree(tmp_path / ".git")
+    assert s.get_git_blob_ids(tmp_path) is None
+
+
+def test_cached_core_text(view_definition, configuration):
+    s = SqlDirective(None, None, None, None, None, None, None, None, None)
+    cache, new_cache = {}, {}
+    core = s.get_cached_core_text(
+        configuration, "v.sql", None, lambda: view_definition, cache, new_cache
+    )
+    assert core.name == "myschema.myview"
+
+    # A known content key matching the cache entry is served without reading
+    def read():
+        raise AssertionError("file was read")
+
+    cache = {"v.sql": ("abc", core, [], [])}
+    new_cache = {}
+    cached = s.get_cached_core_text(
+        configuration, "v.sql", "abc", read, cache, new_cache
+    )
+    assert cached is core
+    assert new_cache == {"v.sql": ("abc", core, [], [])}
+
+    # Options changing the parse results or the budgets change the cache key
+    cache_key = s.get_parse_cache_key(configuration, "src")
+    configuration.sphinxsql_max_file_size = 100
+    assert s.get_parse_cache_key(configuration, "src") != cache_key
+    configuration.sphinxsql_max_file_size = None
+    configuration.sphinxsql_include_table_attributes = False
+    assert s.get_parse_cache_key(configuration, "src") != cache_key
+
+
+@pytest.mark.parametrize("suffix", ["tar.gz", "zip"])
+def test_sql_archive_sources(tmp_path, view_definition, configuration, suffix):
+    import tarfile
+    import zipfile
+
+    archive = tmp_path / "release.{}".format(suffix)
+    (tmp_path / "sql").mkdir()
+    (tmp_path / "sql" / "my_view.sql").write_text(view_definition)
+    (tmp_path / "sql" / "notes.txt").write_text("not sql")
+    if suffix == "zip":
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.write(tmp_path / "sql" / "my_view.sql", "sql/my_view.sql")
+            zf.write(tmp_path / "sql" / "notes.txt", "sql/notes.txt")
+    else:
+        with tarfile.open(archive, "w:gz") as tf:
+            tf.add(tmp_path / "sql", "sql")
+
+    s = SqlDirective(None, None, None, None, None, None, None, None, None)
+    assert s.is_sql_archive(archive)
+    assert not s.is_sql_archive(tmp_path / "sql")
+
+    cores = []
+    for file, key, read in s.get_sql_sources(archive):
+        assert file == archive / "sql" / "my_view.sql"
+        assert (key is None) == (suffix != "zip")
+        cores.append(s.get_cached_core_text(configuration, file, key, read, {}, {}))
+    assert [core.name for core in cores] == ["myschema.myview"]
+    expected_count = 1 if suffix == "zip" else None
+    assert s.count_sql_archive_members(archive) == expected_count
+
+
+def test_parse_budget_size(view_definition, configuration):
+    configuration.sphinxsql_max_file_size = 10
+    s = SqlDirective(None, None, None, None, None, None, None, None, None)
+    with pytest.raises(ParseBudgetExceeded) as e:
+        s.parse_with_budget(configuration, view_definition, "v.sql")
+    assert e.value.phase == "read"
+
+    # Files on disk are checked before they are read
+    def read():
+        raise AssertionError("file was read")
+
+    with pytest.raises(ParseBudgetExceeded):
+        s.get_cached_core_text(configuration, __file__, "abc", read, {}, {})
+
+
+def test_parse_budget_skip_cached(view_definition, configuration):
+    s = SqlDirective(None, None, None, None, None, None, None, None, None)
+    skipped = ParseBudgetExceeded("header comment", "1s timeout")
+    assert pickle.loads(pickle.dumps(skipped)).reason == "1s timeout"
+
+    contents = view_definition + "COMMENT ON VIEW myschema.myview IS 'slow';\n"
+    new_cache = {}
+    with patch.object(s, "parse_with_budget", side_effect=skipped) as parse:
+        with pytest.raises(ParseBudgetExceeded):
+            s.get_cached_core_text(
+                configuration, "v.sql", "abc", lambda: contents, {}, new_cache
+            )
+        assert new_cache["v.sql"][3] == [["VIEW", "myschema.myview", "slow"]]
+
+        # An unchanged file is skipped again without another parse
+        with pytest.raises(ParseBudgetExceeded) as e:
+            s.get_cached_core_text(
+                configuration, "v.sql", "abc", lambda: contents, new_cache, {}
+            )
+        assert e.value.phase == "header comment"
+        assert parse.call_count == 1
+
+
+@pytest.mark.skipif(
+    multiprocessing.get_start_method() != "fork",
+    reason="the patched parser only reaches the worker when forked",
+)
+def test_parse_budget_watchdog(view_definition, configuration):
+    watchdog = ParseWatchdog(configuration, 30, None)
+    try:
+        core = watchdog.parse(view_definition, "v.sql")
+        assert core.name == "myschema.myview"
+
+        # A pathological file is stopped and reported with its phase
+        watchdog.timeout = 0.5
+        with patch.object(
+            SqlDirective, "extract_comments", lambda self, c: time.sleep(30)
+        ):
+            watchdog.stop()
+            with pytest.raises(ParseBudgetExceeded) as e:
+                watchdog.parse(view_definition, "slow.sql")
+        assert e.value.phase == "header comment"
+        assert watchdog.process is None
+    finally:
+        watchdog.close()
+
+
+def test_issue_summary():
+    s = SqlDirective(None, None, None, None, None, None, None, None, None)
+    s.issues = []
+    for i in range(7):
+        s.report_issue("no_comments", f"file_{i}.sql", "no comments")
+    s.report_issue("malformed_table", "myschema.mytable", "bad change log")
+    with patch("sphinx_sql.sphinx_sql.logger") as logger:
+        s.summarize_issues()
+    messages = [call.args[0] for call in logger.warning.call_args_list]
+    assert len(messages) == 2
+    assert messages[0].startswith("sphinx-sql: 7 file(s) without usable")
+    assert "file_4.sql (+2 more)" in messages[0]
+    assert "file_5.sql" not in messages[0]
+    assert messages[1].endswith(": myschema.mytable")
+
+
+def test_partition_children(table_definition, configuration):
+    s = SqlDirective(None, None, None, None, None, None, None, None, None)
+    parent = s.parse_core_text(configuration, table_definition, "mytable.sql")
+    child = s.parse_core_text(
+        configuration,
+        "/* Purpose: partition of the table */\n"
+        "CREATE TABLE myschema.mytable_2021 PARTITION OF myschema.mytable\n"
+        "    FOR VALUES FROM ('2021-01-01')  TO ('2022-01-01');\n",
+        "mytable_2021.sql",
+    )
+    attached = s.parse_core_text(
+        configuration,
+        "/* Purpose: default partition */\n"
+        "CREATE TABLE myschema.mytable_default (id bigint);\n"
+        "ALTER TABLE ONLY myschema.mytable ATTACH PARTITION myschema.mytable_default"
+        " DEFAULT;\n",
+        "mytable_default.sql",
+    )
+    orphan = s.parse_core_text(
+        configuration,
+        "/* Purpose: parent is not documented */\n"
+        "CREATE TABLE other.child PARTITION OF other.parent FOR VALUES IN (1, 2);\n",
+        "child.sql",
+    )
+    assert child.partition_of == "myschema.mytable"
+    assert child.partition_bound == "FOR VALUES FROM ('2021-01-01') TO ('2022-01-01')"
+    assert not hasattr(child, "cols")
+    assert attached.partition_bound == "DEFAULT"
+
+    cores = s.collapse_partitions([orphan, parent, child, attached])
+    assert [core.name for core in cores] == ["other.child", "myschema.mytable"]
+    assert cores[1].partitions == [
+        ["myschema.mytable_2021", child.partition_bound],
+        ["myschema.mytable_default", "DEFAULT"],
+    ]
+    assert not hasattr(parent, "partitions")
+
+    section = s.build_docutil_node(cores[1])
+    tables = {node["kind"]: node for node in section.findall(sql_table)}
+    assert tables["partitions"]["header"] == ("Name", "Bound")
+    assert len(tables["partitions"]["rows"]) == 2
+    section = s.build_docutil_node(cores[0])
+    assert section.children[2].rawsource == "PARTITION OF: other.parent FOR VALUES IN (1, 2)"
+
+
+def test_comment_index(table_definition, configuration):
+    s = SqlDirective(None, None, None, None, None, None, None, None, None)
+    cache, new_cache = {}, {}
+    comments = (
+        "COMMENT ON TABLE myschema.mytable IS 'Customer names';\n"
+        "COMMENT ON COLUMN myschema.mytable.l_name IS 'Family name, ''as given''';\n"
+        "COMMENT ON COLUMN myschema.mytable.id IS 'Older comment';\n"
+        "COMMENT ON FUNCTION \"MySchema\".fn(integer, text) IS 'A function';\n"
+    )
+    core = s.get_cached_core_text(
+        configuration, "a.sql", None, lambda: table_definition, cache, new_cache
+    )
+    s.get_cached_core_text(
+        configuration, "b.sql", None, lambda: comments, cache, new_cache
+    )
+    s.get_cached_core_text(
+        configuration,
+        "c.sql",
+        None,
+        lambda: "COMMENT ON COLUMN myschema.mytable.id IS 'Surrogate key';",
+        cache,
+        new_cache,
+    )
+    assert new_cache["b.sql"][3][3] == ["FUNCTION", "myschema.fn", "A function"]
+    # Files holding only COMMENT ON statements are not reported
+    assert new_cache["b.sql"][1] is None
+    assert new_cache["b.sql"][2] == []
+    s.issues = []
+    s.get_cached_core_text(
+        configuration, "d.sql", None, lambda: "DELETE FROM x;", cache, new_cache
+    )
+    assert [issue[0] for issue in s.issues] == ["unparsable"]
+    s.issues = None
+
+    index = s.build_comment_index(new_cache)
+    assert index[("COLUMN", "myschema.mytable.id")] == "Surrogate key"
+    [joined] = s.join_comment_index([core], index)
+    assert joined.description == "Customer names"
+    assert joined.cols[1] == ["id", "bigserial", "Surrogate key"]
+    assert joined.cols[2][2] == ""
+    assert joined.cols[3][2] == "Family name, 'as given'"
+    assert not hasattr(core, "description")
+    assert core.cols[1][2] == ""
+
+    section = s.build_docutil_node(joined)
+    assert section.children[4].rawsource == "DESCRIPTION:"
+    assert section.children[5].astext() == "Customer names"
+
+
+def test_name_matcher():
+    names = ["s.a", "s.ab", "s.b", "t.s.a"] + ["x.obj_{}".format(i) for i in range(20000)]
+    matcher = NameMatcher(names)
+    text = 'select * from s.ab join s.a.col, x.obj_19999 where t.s.a > s.abc and xs.b'
+    assert matcher.find(text) == {"s.ab", "s.a", "x.obj_19999", "t.s.a"}
+    assert matcher.find("") == set()
+
+
+def test_infer_dependencies(view_definition, table_definition, configuration):
+    configuration.sphinxsql_infer_dependencies = True
+    s = SqlDirective(None, None, None, None, None, None, None, None, None)
+    view = s.parse_core_text(
+        configuration,
+        view_definition.replace(
+            "SELECT", "SELECT * FROM myschema.mytable JOIN myschema.other; SELECT"
+        ),
+        "v.sql",
+    )
+    table = s.parse_core_text(configuration, table_definition, "t.sql")
+    other = s.parse_core_text(
+        configuration,
+        table_definition.replace("myschema.mytable", "myschema.other"),
+        "o.sql",
+    )
+    view.comments.dependencies = [["Type", "Name"], ["Table", "MySchema.MyTable"]]
+    assert "myschema.mytable" in view.body
+
+    cores = s.infer_dependencies([table, other, view], [table, other, view])
+    assert cores[2].inferred_dependencies == [
+        ["TABLE", "myschema.mytable", "yes"],
+        ["TABLE", "myschema.other", "MISSING"],
+    ]
+    assert not hasattr(cores[2], "body")
+    assert hasattr(view, "body")
+
+    section = s.build_docutil_node(cores[2])
+    lines = [child.rawsource for child in section.children]
+    inferred = section.children[lines.index("INFERRED DEPENDENCIES:") + 1]
+    assert lines.index("INFERRED DEPENDENCIES:") > lines.index("DEPENDANT OBJECTS:")
+    assert inferred["header"] == ("Type", "Name", "Declared")
+    assert inferred["link_column"] == 1
+
+
+def test_partition_detection(configuration):
+    s = SqlDirective(None, None, None, None, None, None, None, None, None)
+    same_file = (
+        "/* Purpose: sales with partitions */\n"
+        "CREATE TABLE s.sales (\n    id bigint,\n    sold date\n) PARTITION BY RANGE (sold);\n"
+        "CREATE TABLE s.sales_2021 PARTITION OF s.sales\n"
+        "    FOR VALUES FROM ('2021-01-01') TO ('2022-01-01');\n"
+    )
+    parent = s.parse_core_text(configuration, same_file, "sales.sql")
+    assert not hasattr(parent, "partition_of")
+    assert [col[0] for col in parent.cols[1:]] == ["id", "sold"]
+    assert s.extract_partition_parent(same_file, "s.sales_2021") == (
+        "s.sales",
+        "FOR VALUES FROM ('2021-01-01') TO ('2022-01-01')",
+    )
+
+    commented = (
+        "/* Purpose: archive */\n"
+        "CREATE TABLE s.archive (\n    id bigint\n);\n"
+        "-- was a partition of s.old FOR VALUES IN (1)\n"
+        "COMMENT ON TABLE s.archive IS 'Rows that used to be a partition of s.history';\n"
+    )
+    archive = s.parse_core_text(configuration, commented, "archive.sql")
+    assert not hasattr(archive, "partition_of")
+    assert archive.cols[1][0] == "id"
+
+    constrained = (
+        "CREATE TABLE s.p_1 PARTITION OF s.p (CONSTRAINT ck CHECK (id > 0))\n"
+        "    FOR VALUES IN (1);\n"
+    )
+    assert s.extract_partition_parent(constrained, "s.p_1") == (
+        "s.p",
+        "FOR VALUES IN (1)",
+    )
+    assert s.extract_partition_parent(
+        "CREATE TABLE s.p PARTITION OF s.p DEFAULT;", "s.p"
+    ) is None
+
+
+def test_find_outdated_docs(tmp_path):
+    (tmp_path / "a.sql").write_text("")
+    env = SimpleNamespace(
+        sphinxsql_sources={
+            "schema": [(str(tmp_path), [str(tmp_path / "a.sql")])],
+            "removed": [(str(tmp_path), [])],
+        }
+    )
+    assert find_outdated_docs(None, env, set(), set(), {"removed"}) == []
+
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "comments.sql").write_text("")
+    assert find_outdated_docs(None, env, set(), set(), {"removed"}) == ["schema"]
+
+
+def test_write_search_shards(tmp_path):
+    app = SimpleNamespace(
+        config=SimpleNamespace(sphinxsql_compact_search_index=True),
+        builder=SimpleNamespace(format="html", get_target_uri=lambda doc: doc + ".html"),
+        env=SimpleNamespace(
+            sphinxsql_search_entries={
+                "schema": [
+                    ("myschema.t", "myschema.t", "myschema-t", "TABLE"),
+                    ("m", "m", "m", "ROLE"),
+                ]
+            }
+        ),
+        outdir=str(tmp_path),
+    )
+    write_search_shards(app, None)
+    shard_dir = tmp_path / "_static" / "sphinxsql"
+    assert json.loads((shard_dir / "shards.json").read_text()) == ["m", "my"]
+    assert json.loads((shard_dir / "my.json").read_text()) == {
+        "myschema.t": [["myschema.t", "schema.html#myschema-t", "TABLE"]]
+    }
+
+
+def test_infer_dependencies_ignores_comments(configuration):
+    configuration.sphinxsql_infer_dependencies = True
+    s = SqlDirective(None, None, None, None, None, None, None, None, None)
+
+    def table(name):
+        return s.parse_core_text(
+            configuration, f"/* Purpose: t */\nCREATE TABLE {name} (id bigint);\n", "t.sql"
+        )
+
+    view = s.parse_core_text(
+        configuration,
+        "/* Purpose: v */\nCREATE VIEW s.v AS\n"
+        "-- used to read s.old\n/* and s.old too */\n"
+        "SELECT 's.old' AS note FROM s.cur JOIN s.cur_2021 USING (id);\n",
+        "v.sql",
+    )
+    partition = table("s.cur_2021")
+    partition.partition_of, partition.partition_bound = "s.cur", "DEFAULT"
+    known = [table("s.cur"), partition, table("s.old"), view]
+    cores = s.collapse_partitions(known)
+    assert [core.name for core in cores] == ["s.cur", "s.old", "s.v"]
+
+    view = s.infer_dependencies(cores, known)[2]
+    assert view.inferred_dependencies == [
+        ["TABLE", "s.cur", "MISSING"],
+        ["TABLE", "s.cur_2021", "MISSING"],
+    ]